@@ -0,0 +1,84 @@
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from dataStore import DEFAULT_CSV_PATH, path_fingerprint, has_derived, typed_frame
+from graphImporte import build_importe_rollup, get_importe_rollup
+from graphRisk import build_risk_counts, get_risk_counts, build_account_age_index, get_account_age_index
+from kpiEngine import build_kpi_stats, get_kpi_stats, kpis_from_stats
+from ingest import append_rows, get_watermark
+from syntheticData import CHECK_ROWS, synthetic_path
+
+# Parity of the incremental append path with a cold rebuild: a copy of the csv
+# without its last rows is loaded and its rollups are built, then those rows
+# are appended in batches through ingest.append_rows. After each batch every
+# rollup must have been merged (not rebuilt) and must equal the same rollup
+# built from scratch on the grown file.
+# Run with: python appendParity.py [csv] (default: a synthetic csv in Data/synthetic)
+BATCHES = 2
+BATCH_ROWS = 1000
+
+
+def _merged_names():
+    day = pd.Timestamp.now().date().isoformat()
+    return ["importe_rollup", "risk_counts", f"account_age_index:{day}", "kpi_stats", "loan_request_watermark"]
+
+
+def _snapshot(path):
+    return {
+        "importe rollup": get_importe_rollup(path),
+        "risk counts": get_risk_counts(path),
+        "account age index": get_account_age_index(path),
+        "kpis": get_kpi_stats(path)[0],
+        "watermark": get_watermark(path),
+    }
+
+
+def _checks(path, merged):
+    # Cold rebuild from the file, bypassing every cache
+    df = typed_frame(pd.read_csv(path))
+    rollup = build_importe_rollup(df)
+    yield "importe rollup", merged["importe rollup"].reset_index().equals(rollup.reset_index())
+
+    counts, years = build_risk_counts(df)
+    merged_counts, merged_years = merged["risk counts"]
+    yield "risk counts", np.array_equal(merged_counts, counts) and pd.Index(merged_years).equals(pd.Index(years))
+
+    index = build_account_age_index(df, merged["account age index"]["now"])
+    yield "account age index", np.array_equal(merged["account age index"]["prefix"], index["prefix"]) and pd.Index(
+        merged["account age index"]["years"]).equals(pd.Index(index["years"]))
+
+    yield "kpis", kpis_from_stats(merged["kpis"]) == kpis_from_stats(build_kpi_stats(df))
+    yield "watermark", merged["watermark"] == df["loan_request_id"].max()
+
+
+def run_parity_checks(path=DEFAULT_CSV_PATH):
+    # Prints one line per check; True when every check passed
+    source = pd.read_csv(path)
+    base_rows = max(0, len(source) - BATCHES * BATCH_ROWS)
+    directory = tempfile.mkdtemp(prefix="appendParity-")
+    passed = True
+    try:
+        copy = os.path.join(directory, os.path.basename(path))
+        source.iloc[:base_rows].to_csv(copy, index=False)
+        _snapshot(copy)
+        for batch in range(BATCHES):
+            rows = source.iloc[base_rows + batch * BATCH_ROWS:base_rows + (batch + 1) * BATCH_ROWS]
+            appended = append_rows(rows, copy)
+            fingerprint = path_fingerprint(copy)
+            checks = [(f"merged {name}", has_derived(name, fingerprint)) for name in _merged_names()]
+            checks += list(_checks(copy, _snapshot(copy)))
+            for name, ok in checks:
+                print(f"[appendParity] {'ok  ' if ok else 'FAIL'} batch {batch + 1} ({appended} rows) {name}", flush=True)
+                passed = passed and bool(ok)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return passed
+
+
+if __name__ == "__main__":
+    sys.exit(0 if run_parity_checks(sys.argv[1] if len(sys.argv) > 1 else synthetic_path(CHECK_ROWS)) else 1)
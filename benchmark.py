@@ -0,0 +1,218 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import dataStore
+from dataStore import DATA_DIR, load_dataset, with_columns
+from graphImporte import build_importe_rollup, get_importe_rollup, get_importe_plotly_figure
+from graphRisk import (
+    build_risk_counts,
+    get_risk_counts,
+    get_risk_plotly_figure,
+    build_account_age_index,
+    get_account_age_index,
+    get_affiliation_year_bounds,
+    count_accounts_by_age,
+    get_account_age_plotly_figure_by_affiliation,
+)
+from kpiEngine import build_kpi_stats, kpis_from_stats, get_kpis, kpi_table_frames
+from riskAnalytics import (
+    build_filter_index,
+    filter_mask,
+    canonical_filter,
+    build_summary_cube,
+    summaries_from_cube,
+    build_risk_page_summaries,
+)
+from syntheticData import parse_size, synthetic_path
+
+# Times the chart builders, the KPI computations and the Risk Management
+# aggregations on synthetic datasets of increasing size. Every case runs on a
+# frame the caches do not know (uncached=True), so it measures the full build;
+# "cached" cases measure the per-rerun cost once the dataset's derived values
+# exist. Results are written as json for --compare.
+# Run with: python benchmark.py --sizes 10k,100k,1M [--repeats 3]
+BENCHMARK_DIR = os.path.join(DATA_DIR, "benchmarks")
+DEFAULT_SIZES = "10k,100k,1M"
+# Configuration that changes what is measured, recorded with every run
+ENV_KEYS = [
+    "NEXUS_QUERY_BACKEND", "NEXUS_SHARED_DATASET", "NEXUS_DERIVED_CACHE", "NEXUS_FIGURE_WORKERS",
+]
+
+
+def _risk_page_frame(df):
+    # The Risk page's preprocessing (see pages/User_Persona_Dashboard.py)
+    fecha_afiliacion = pd.to_datetime(df['fecha_afiliacion'])
+    return with_columns(
+        df,
+        fecha_afiliacion=fecha_afiliacion,
+        days_since_affiliation=(pd.Timestamp.today().normalize() - fecha_afiliacion).dt.days,
+    )
+
+
+def _cases(path):
+    # (group, name, work) triples for one dataset. `frame` is a shallow copy
+    # of the loaded dataset: same data, but unknown to the derived caches.
+    df = load_dataset(path)
+    frame = df.copy(deep=False)
+    now = pd.Timestamp.now()
+    bounds = get_affiliation_year_bounds(path)
+    age_index = build_account_age_index(frame, now)
+    risk_frame = _risk_page_frame(frame)
+    filter_index = build_filter_index(frame)
+    risks = filter_index['risk_values']
+    categories = [value for value in filter_index['category'] if isinstance(value, str)][:2]
+    subset_mask = filter_mask(filter_index, risks[:1], categories)
+    cube = build_summary_cube(risk_frame)
+    stats = build_kpi_stats(frame)
+    kpis = kpis_from_stats(stats)
+    year = int(frame['year'].mode().iloc[0]) if 'year' in frame.columns else "All"
+
+    return [
+        ("importe", "build_importe_rollup", lambda: build_importe_rollup(frame)),
+        ("importe", "get_importe_plotly_figure All", lambda: get_importe_plotly_figure(frame)),
+        ("importe", f"get_importe_plotly_figure {year}", lambda: get_importe_plotly_figure(frame, year=year)),
+        ("importe", "get_importe_plotly_figure All (cached)", lambda: get_importe_plotly_figure(path)),
+        ("risk", "build_risk_counts", lambda: build_risk_counts(frame)),
+        ("risk", "get_risk_plotly_figure All", lambda: get_risk_plotly_figure(frame)),
+        ("risk", f"get_risk_plotly_figure {year}", lambda: get_risk_plotly_figure(frame, year=year)),
+        ("risk", "get_risk_plotly_figure All (cached)", lambda: get_risk_plotly_figure(path)),
+        ("account_age", "build_account_age_index", lambda: build_account_age_index(frame, now)),
+        ("account_age", "count_accounts_by_age", lambda: count_accounts_by_age(age_index, bounds)),
+        ("account_age", "get_account_age_plotly_figure_by_affiliation",
+         lambda: get_account_age_plotly_figure_by_affiliation(frame, year_range=bounds)),
+        ("account_age", "get_account_age_plotly_figure_by_affiliation (cached)",
+         lambda: get_account_age_plotly_figure_by_affiliation(path, year_range=bounds)),
+        ("kpi", "build_kpi_stats", lambda: build_kpi_stats(frame)),
+        ("kpi", "kpis_from_stats", lambda: kpis_from_stats(stats)),
+        ("kpi", "get_kpis", lambda: get_kpis(frame)),
+        ("kpi", "kpi_table_frames", lambda: kpi_table_frames(kpis)),
+        ("risk_page", "preprocess", lambda: _risk_page_frame(frame)),
+        ("risk_page", "build_filter_index", lambda: build_filter_index(frame)),
+        ("risk_page", "filter_mask all", lambda: filter_mask(filter_index, risks, [])),
+        ("risk_page", "filter_mask subset", lambda: filter_mask(filter_index, risks[:1], categories)),
+        ("risk_page", "canonical_filter", lambda: canonical_filter(filter_index, risks, categories)),
+        ("risk_page", "build_risk_page_summaries all", lambda: build_risk_page_summaries(risk_frame)),
+        ("risk_page", "build_risk_page_summaries subset", lambda: build_risk_page_summaries(risk_frame[subset_mask])),
+        ("risk_page", "summaries_from_cube", lambda: summaries_from_cube(cube)),
+    ]
+
+
+def _time(work, repeats):
+    runs = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        work()
+        runs.append(time.perf_counter() - start)
+    return runs
+
+
+def _record(rows, group, name, runs):
+    return {
+        "rows": rows,
+        "group": group,
+        "case": name,
+        "runs": [round(run, 6) for run in runs],
+        "min": round(min(runs), 6),
+        "median": round(statistics.median(runs), 6),
+    }
+
+
+def _remove_sidecar(path):
+    sidecar = dataStore.sidecar_path(path)
+    if os.path.exists(sidecar):
+        os.remove(sidecar)
+
+
+def run_benchmarks(sizes, repeats=3, seed=0, only=None):
+    records = []
+    for rows in sizes:
+        start = time.perf_counter()
+        path = synthetic_path(rows, seed)
+        print(f"[benchmark] {rows:,} rows: {path} ({time.perf_counter() - start:.1f}s)", flush=True)
+
+        # Loading is timed once from the csv alone, then from the process cache
+        _remove_sidecar(path)
+        cases = [
+            ("load", "load_dataset (first load)", _time(lambda: load_dataset(path), 1)),
+            ("load", "load_dataset (cached)", _time(lambda: load_dataset(path), repeats)),
+        ]
+        # Fill the caches the "(cached)" cases read from
+        get_importe_rollup(path)
+        get_risk_counts(path)
+        get_account_age_index(path)
+
+        for group, name, work in _cases(path):
+            if only and group not in only:
+                continue
+            cases.append((group, name, _time(work, repeats)))
+
+        for group, name, runs in cases:
+            record = _record(rows, group, name, runs)
+            records.append(record)
+            print(f"[benchmark] {rows:>10,} {group:<12} {name:<56} median {record['median'] * 1000:10.2f} ms", flush=True)
+    return records
+
+
+def _metadata(repeats, seed):
+    return {
+        "created": pd.Timestamp.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "repeats": repeats,
+        "seed": seed,
+        "env": {key: os.environ[key] for key in ENV_KEYS if key in os.environ},
+    }
+
+
+def write_results(records, metadata, path=None):
+    if path is None:
+        os.makedirs(BENCHMARK_DIR, exist_ok=True)
+        path = os.path.join(BENCHMARK_DIR, f"benchmark-{pd.Timestamp.now():%Y%m%d-%H%M%S}.json")
+    with open(path, "w") as f:
+        json.dump({"metadata": metadata, "results": records}, f, indent=1)
+    return path
+
+
+def compare(baseline_path, candidate_path):
+    # Median of every case in the candidate run relative to the baseline
+    with open(baseline_path) as f:
+        baseline = {(r["rows"], r["case"]): r for r in json.load(f)["results"]}
+    with open(candidate_path) as f:
+        candidate = json.load(f)["results"]
+    for record in candidate:
+        before = baseline.get((record["rows"], record["case"]))
+        if before is None:
+            continue
+        ratio = record["median"] / before["median"] if before["median"] else float("inf")
+        print(f"{record['rows']:>10,} {record['case']:<56} {before['median'] * 1000:10.2f} ms -> "
+              f"{record['median'] * 1000:10.2f} ms  x{ratio:.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the chart builders, KPIs and Risk page aggregations")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"comma-separated row counts, 10k to 50M (default {DEFAULT_SIZES})")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", help="comma-separated groups: importe, risk, account_age, kpi, risk_page")
+    parser.add_argument("--output", help=f"results json (default: {BENCHMARK_DIR}/benchmark-<time>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CANDIDATE"), help="compare two results files and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        sys.exit(0)
+    sizes = [parse_size(size) for size in args.sizes.split(",")]
+    only = set(args.only.split(",")) if args.only else None
+    records = run_benchmarks(sizes, args.repeats, args.seed, only)
+    print(f"[benchmark] results: {write_results(records, _metadata(args.repeats, args.seed), args.output)}")
@@ -1,24 +1,13 @@
-import streamlit as st
-import pandas as pd
-import numpy as np 
 import os
-import json
-import plotly.express as px
-import plotly.graph_objects as go
+import streamlit as st
 from streamlit_option_menu import option_menu
-from graphImporte import get_importe_plotly_figure
-from graphRisk import get_risk_plotly_figure, get_account_age_plotly_figure_by_affiliation
-import time
-
-# Import your page modules
-from pages import Acerca_de, Key_Findings, User_Persona_Dashboard, Meet_Nexus, ML_Models
-
-# Then, use them as:
-page1 = Acerca_de
-page2 = Key_Findings
-page3 = User_Persona_Dashboard
-page4 = Meet_Nexus
-page5 = ML_Models
+from dataStore import DEFAULT_CSV_PATH, store_upload, missing_columns
+# Page modules and the chart stack are imported on first selection
+from pageRegistry import PAGES, load_page
+from fragmentTrace import traced_fragment
+import figurePool
+from perfSpans import span, start_metrics_server
+from perfPanel import plotly_chart, show_perf_panel
 
 st.set_page_config(
     page_title='NEXUS Dashboard',
@@ -46,31 +35,43 @@ st.markdown(
     unsafe_allow_html=True,
 )
 
+# Serves /metrics when NEXUS_METRICS_PORT is set (once per process)
+start_metrics_server()
+
+# Without the private csv the data tabs work from an uploaded file
+csv_path = DEFAULT_CSV_PATH if os.path.exists(DEFAULT_CSV_PATH) else None
+DATA_PAGES = {"Dashboard", "Risk Management"}
+
 # --- SPLASH SCREEN ---
+# Shown while the background worker loads the data and builds the caches;
+# skipped entirely when another session has already warmed them up
 if "splash_shown" not in st.session_state:
-    splash = st.empty()
-    with splash.container():
-        st.markdown(
-            """
-            <style>
-            /* Change progress bar color */
-            .stProgress > div > div > div > div {
-                background-color: #d9ccef !important;
-            }
-            </style>
-            <div style="display:flex;flex-direction:column;align-items:center;justify-content:center;height:60vh;">
-                <img src="https://raw.githubusercontent.com/jorge-mata/DataAnalytics_Dashboard_Streamlit/refs/heads/main/NEXUS.png" width="180"/>
-                <h1 style="color:#824d74;text-align:center;">Welcome to NEXUS Dashboard</h1>
-                <p style="font-size:1.2rem;color:#d88876;text-align:center;">Loading, please wait...</p>
-            </div>
-            """,
-            unsafe_allow_html=True,
-        )
-        progress = st.progress(0)
-        for percent in range(1, 101):
-            time.sleep(2/100)  # 2 seconds total
-            progress.progress(percent)
-    splash.empty()
+    warmup = load_page("Dashboard")
+    if csv_path is not None and not warmup.is_warm(csv_path):
+        splash = st.empty()
+        with splash.container():
+            st.markdown(
+                """
+                <style>
+                /* Change progress bar color */
+                .stProgress > div > div > div > div {
+                    background-color: #d9ccef !important;
+                }
+                </style>
+                <div style="display:flex;flex-direction:column;align-items:center;justify-content:center;height:60vh;">
+                    <img src="https://raw.githubusercontent.com/jorge-mata/DataAnalytics_Dashboard_Streamlit/refs/heads/main/NEXUS.png" width="180"/>
+                    <h1 style="color:#824d74;text-align:center;">Welcome to NEXUS Dashboard</h1>
+                    <p style="font-size:1.2rem;color:#d88876;text-align:center;">Loading, please wait...</p>
+                </div>
+                """,
+                unsafe_allow_html=True,
+            )
+            progress = st.progress(0)
+            job = warmup.start_warmup(csv_path)
+            while not job["done"].wait(0.05):
+                progress.progress(job["completed"] / job["total"], text=job["stage"])
+            progress.progress(100)
+        splash.empty()
     st.session_state["splash_shown"] = True
 
 # --- END SPLASH SCREEN ---
@@ -98,106 +99,155 @@ selected = option_menu(
     }
 )
 
-DEFAULT_CSV_PATH = os.path.join(os.path.dirname(__file__), "Data", "aggregated_df.csv")
-csv_path = DEFAULT_CSV_PATH
-
-if csv_path is None:
-    st.warning("Please upload a CSV file to continue.")
-    st.stop()
-
-if selected == "Dashboard":
-    st.markdown("## Insights Hub")
-
-    kpi_json_path = os.path.join(os.path.dirname(__file__), "kpis.json")
-    with open(kpi_json_path, "r") as f:
-        kpis = json.load(f)
-
+if csv_path is None and selected in DATA_PAGES:
+    uploaded_file = st.file_uploader("Upload aggregated_df.csv", type="csv")
+    if uploaded_file is None:
+        st.warning("Please upload a CSV file to continue.")
+        st.stop()
+    # Stored once per content, so reruns and other sessions reuse its caches.
+    # The Dashboard builders stream the stored copy in chunks (see uploadStream).
+    csv_path = store_upload(uploaded_file)[0]
+
+# A data tab needs the columns its page module lists in REQUIRED_COLUMNS;
+# they are looked up once per dataset version, and the chart builders
+# assume them present
+if selected in DATA_PAGES:
+    missing = missing_columns(csv_path, load_page(selected).REQUIRED_COLUMNS)
+    if missing:
+        st.error(f"The CSV lacks the columns: {', '.join(missing)}")
+        st.stop()
+
+# Each Dashboard block is a fragment: a widget inside one reruns only that
+# block, not the whole script (see fragmentTrace for the run counters)
+@traced_fragment("kpi_metrics")
+def kpi_metrics(kpis):
     kpi1, kpi2 = st.columns(2)
     with kpi1:
         st.metric("Loan Approval Rate", f"{kpis['Loan Approval Rate']:.2%}")
     with kpi2:
         st.metric("Delinquency Rate", f"{kpis['Delinquency Rate']:.2%}")
 
-    st.markdown("---")
-
-    chart_col1, chart_col2 = st.columns(2)
-
-    with chart_col1:
-        df = pd.read_csv(csv_path)
-        years_importe = df['year'].unique().tolist() if 'year' in df.columns else [2024]
-        years_importe = ["All"] + [str(y) for y in sorted(years_importe)]
-        selected_year_str_importe = st.selectbox(
-            "Select Year for Importe", years_importe, key="importe_year"
-        )
-        selected_year_importe = "All" if selected_year_str_importe == "All" else int(selected_year_str_importe)
-        importe_fig = get_importe_plotly_figure(csv_path, year=selected_year_importe, height=500)
-        importe_fig.update_layout(title_text=f"Total amount per month and monthly average per quarter ({selected_year_importe})")
-        st.plotly_chart(importe_fig, use_container_width=True)
-
-    with chart_col2:
-        df = pd.read_csv(csv_path)
-        years_risk = df['year'].unique().tolist() if 'year' in df.columns else [2024]
-        years_risk = ["All"] + [str(y) for y in sorted(years_risk)]
-        selected_year_str_risk = st.selectbox(
-            "Select Year for Risk", years_risk, key="risk_year"
-        )
-        selected_year_risk = "All" if selected_year_str_risk == "All" else int(selected_year_str_risk)
-        risk_fig = get_risk_plotly_figure(csv_path, year=selected_year_risk, height=500)
-        risk_fig.update_layout(title_text=f"Risk Client Counts and Percentage by Month ({selected_year_risk})")
-        st.plotly_chart(risk_fig, use_container_width=True)
-
-    st.markdown("---")
-
-    df = pd.read_csv(csv_path)
-    af_years = pd.to_datetime(df['fecha_afiliacion']).dt.year
-    min_af_year, max_af_year = int(af_years.min()), int(af_years.max())
+
+def year_param(selected_year_str):
+    return "All" if selected_year_str == "All" else int(selected_year_str)
+
+
+@traced_fragment("importe_chart")
+def importe_chart(warmup, years, prefetched=None):
+    years_importe = ["All"] + [str(y) for y in years]
+    selected_year_str_importe = st.selectbox(
+        "Select Year for Importe", years_importe, key="importe_year"
+    )
+    selected_year_importe = year_param(selected_year_str_importe)
+    importe_fig = figurePool.resolve(prefetched, "importe", selected_year_importe,
+                                     lambda: warmup.dashboard_figure("importe", csv_path, selected_year_importe))
+    importe_fig.update_layout(title_text=f"Total amount per month and monthly average per quarter ({selected_year_importe})")
+    plotly_chart("importe", importe_fig, use_container_width=True)
+
+
+@traced_fragment("risk_chart")
+def risk_chart(warmup, years, prefetched=None):
+    years_risk = ["All"] + [str(y) for y in years]
+    selected_year_str_risk = st.selectbox(
+        "Select Year for Risk", years_risk, key="risk_year"
+    )
+    selected_year_risk = year_param(selected_year_str_risk)
+    risk_fig = figurePool.resolve(prefetched, "risk", selected_year_risk,
+                                  lambda: warmup.dashboard_figure("risk", csv_path, selected_year_risk))
+    risk_fig.update_layout(title_text=f"Risk Client Counts and Percentage by Month ({selected_year_risk})")
+    plotly_chart("risk", risk_fig, use_container_width=True)
+
+
+@traced_fragment("account_age_chart")
+def account_age_chart(warmup, prefetched=None):
+    min_af_year, max_af_year = warmup.get_affiliation_year_bounds(csv_path)
 
     af_year_range = st.session_state.get("af_year_range", (min_af_year, max_af_year))
 
-    account_age_aff_fig = get_account_age_plotly_figure_by_affiliation(csv_path, year_range=af_year_range)
+    account_age_aff_fig = figurePool.resolve(prefetched, "account_age", tuple(af_year_range),
+                                             lambda: warmup.dashboard_figure("account_age", csv_path, tuple(af_year_range)))
     account_age_aff_fig.update_layout(
         title_text="Unique Accounts by Account Age Group"
     )
-    st.plotly_chart(account_age_aff_fig, use_container_width=True)
+    plotly_chart("account_age", account_age_aff_fig, use_container_width=True)
 
-    st.markdown("---")
+
+@traced_fragment("kpi_tables")
+def kpi_tables(warmup, kpis, prefetched=None):
+    frames = figurePool.resolve(prefetched, "kpi_tables", None, lambda: warmup.kpi_table_frames(kpis))
 
     table1, table2, table3 = st.columns(3)
 
     with table1:
         st.markdown("#### Loan Requests per Quarter")
-        st.table(pd.DataFrame(list(kpis["Loan Requests per Quarter"].items()), columns=["Quarter", "Requests"]))
+        st.table(frames["requests"])
 
     with table2:
         st.markdown("#### Repayment Rate per Quarter")
-        repayment_df = pd.DataFrame(
-            [(k, f"{v:.2%}") for k, v in kpis["Loan Repayment Rate per Quarter"].items()],
-            columns=["Quarter", "Repayment Rate"]
-        )
-        st.table(repayment_df)
+        st.table(frames["repayment"])
 
     with table3:
         st.markdown("#### Avg Purchase Value by Payment Type")
-        avg_purchase_df = pd.DataFrame(
-            [(k, f"${v:,.2f}") for k, v in kpis["Average Purchase Value by Payment Type"].items()],
-            columns=["Payment Type", "Average Value"]
-        )
-        st.table(avg_purchase_df)
+        st.table(frames["avg_purchase"])
 
-elif selected == "About Ximple":
-    page1.main()
 
-elif selected == "Main Takeaway":  # Updated to match the new name
-    page2.main()
+if selected == "Dashboard":
+    with span("page:Dashboard"):
+        warmup = load_page("Dashboard")
 
-elif selected == "Risk Management":
-    page3.main()
+        st.markdown("## Insights Hub")
+
+        # Computed from the dataset once per version and written back to kpis.json
+        kpis = warmup.get_kpis(csv_path)
+
+        kpi_metrics(kpis)
+
+        st.markdown("---")
+
+        # Read off the cached importe rollup, so uploads are never loaded whole;
+        # a csv without a year column offers 2024
+        years = warmup.get_importe_years(csv_path) or [2024]
+
+        # With a figure pool, the charts not yet memoized for the current
+        # selections and the KPI tables are built concurrently, so wall time is
+        # close to the slowest build; the blocks still render in page order,
+        # each waiting for its own result
+        prefetched = {}
+        if figurePool.pool_enabled():
+            selections = {
+                "importe": year_param(st.session_state.get("importe_year", "All")),
+                "risk": year_param(st.session_state.get("risk_year", "All")),
+                "account_age": tuple(st.session_state.get("af_year_range", warmup.get_affiliation_year_bounds(csv_path))),
+            }
+            batch = figurePool.new_batch()
+            for kind, param in selections.items():
+                if not warmup.figure_cached(kind, csv_path, param):
+                    prefetched[kind] = figurePool.submit(kind, param, warmup.dashboard_figure, kind, csv_path, param, batch=batch)
+            prefetched["kpi_tables"] = figurePool.submit("kpi_tables", None, warmup.kpi_table_frames, kpis, batch=batch)
 
-elif selected == "Meet Nexus":
-    page4.main()
+        chart_col1, chart_col2 = st.columns(2)
 
-elif selected == "Machine Learning":
-    page5.main()
+        with chart_col1:
+            importe_chart(warmup, years, prefetched)
+
+        with chart_col2:
+            risk_chart(warmup, years, prefetched)
+
+        st.markdown("---")
+
+        account_age_chart(warmup, prefetched)
+
+        st.markdown("---")
+
+        kpi_tables(warmup, kpis, prefetched)
+
+elif selected == "Risk Management":
+    with span(f"page:{selected}"):
+        load_page(selected).main(csv_path)
+
+elif selected in PAGES:
+    with span(f"page:{selected}"):
+        load_page(selected).main()
 
 # --- Preload Meet Nexus images (hidden) ---
 meet_nexus_imgs = [
@@ -211,3 +261,6 @@ meet_nexus_imgs = [
 ]
 for url in meet_nexus_imgs:
     st.markdown(f"<img src='{url}' style='display:none;'>", unsafe_allow_html=True)
+
+# Hidden timing panel, shown with ?admin=1
+show_perf_panel(csv_path)
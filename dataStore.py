@@ -0,0 +1,685 @@
+import hashlib
+import io
+import os
+import threading
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+import diskCache
+from perfSpans import span, timed
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pa_compute
+    import pyarrow.csv as pa_csv
+except ImportError:  # columnar sidecar is optional, fall back to plain csv
+    pa = None
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Data")
+DEFAULT_CSV_PATH = os.path.join(DATA_DIR, "aggregated_df.csv")
+
+HASH_CHUNK_SIZE = 1 << 20
+
+# total_importe is a currency amount; rollups keep its sums in integer cents
+# so that partial sums from appended batches add up exactly
+IMPORTE_SCALE = 100
+
+SIDECAR_SUFFIX = ".arrow"
+
+# NEXUS_SHARED_DATASET=1 hands out frames that are zero-copy, read-only views
+# of the memory-mapped sidecar: numeric and timestamp columns wrap the mapped
+# buffers and strings stay Arrow-backed, so every session and every server
+# process reading the same sidecar shares one copy through the page cache.
+# Only categorical codes are materialized, once per process.
+SHARED_DATASET = os.environ.get("NEXUS_SHARED_DATASET", "0") == "1"
+
+# Uploaded csvs are stored once under their content hash; derived values of
+# the most recent MAX_LIVE_UPLOADS uploads stay cached in memory. On disk the
+# least recently used uploads are removed once they take more than
+# NEXUS_UPLOAD_CACHE_MB (live uploads are always kept).
+UPLOAD_DIR = os.environ.get("NEXUS_UPLOAD_CACHE_DIR", os.path.join(DATA_DIR, "uploads"))
+MAX_LIVE_UPLOADS = 8
+UPLOAD_CACHE_MB = float(os.environ.get("NEXUS_UPLOAD_CACHE_MB", "512"))
+SIDECAR_FINGERPRINT_KEY = b"source_fingerprint"
+
+
+# Typed schema of aggregated_df, validated once per dataset version at load:
+# integers are downcast, the 0/1 flags are uint8, strings are dictionary
+# encoded (categoricals in pandas, with sorted categories) and the
+# affiliation date is parsed once. total_importe stays float64 so cent
+# rollups match the SQL backend exactly. Flags and integers with missing
+# values come out as float64, like any pandas integer column with NaN.
+# Columns missing from the csv are skipped; columns outside the schema keep
+# the csv reader's types.
+DATASET_SCHEMA = {
+    "loan_request_id": "int32",
+    "external_account_id": "category",
+    "approved": "uint8",
+    "total_importe": "float64",
+    "year": "int16",
+    "quarter": "int8",
+    "month": "int8",
+    "ever_delinquent": "uint8",
+    "num_delinquencies": "int16",
+    "most_purchased_category": "category",
+    "medio_pago": "category",
+    "canal": "category",
+    "riskclient": "int8",
+    "es_temporada_alta_real": "uint8",
+    "fecha_afiliacion": "datetime64[ns]",
+}
+# Stored in the sidecar, so sidecars written with another schema are rebuilt
+SCHEMA_VERSION = hashlib.blake2b(repr(sorted(DATASET_SCHEMA.items())).encode(), digest_size=8).hexdigest()
+SIDECAR_SCHEMA_KEY = b"schema_version"
+
+
+def _arrow_type(dtype):
+    if dtype == "category":
+        return pa.dictionary(pa.int32(), pa.string())
+    if dtype == "datetime64[ns]":
+        return pa.timestamp("ns")
+    return pa.from_numpy_dtype(np.dtype(dtype))
+
+
+
+def _cast(column, dtype):
+    # column as dtype, or unchanged when its values do not fit (out of range,
+    # unparseable dates, NaN in an integer column)
+    try:
+        if dtype == "category":
+            return column.astype(dtype)
+        if dtype == "datetime64[ns]":
+            return pd.to_datetime(column).astype(dtype)
+        values = column.to_numpy()
+        if column.isna().any() or not (values.astype(dtype) == values).all():
+            return column
+        return column.astype(dtype)
+    except (ValueError, TypeError, OverflowError):
+        return column
+
+
+def typed_frame(frame):
+    # frame with the DATASET_SCHEMA dtypes; used where the csv is read by
+    # pandas (no pyarrow, or a csv the typed Arrow reader rejects)
+    columns = {}
+    for name in frame.columns:
+        dtype = DATASET_SCHEMA.get(name)
+        column = frame[name]
+        columns[name] = column if dtype is None or str(column.dtype) == dtype else _cast(column, dtype)
+    return pd.DataFrame(columns, index=frame.index, copy=False)
+
+
+def _validate(data):
+    # Schema check of a loaded table or frame: schema columns it lacks and
+    # schema columns stored with another type (column -> actual type)
+    if pa is not None and isinstance(data, pa.Table):
+        actual = {field.name: field.type for field in data.schema}
+        expected = {name: _arrow_type(dtype) for name, dtype in DATASET_SCHEMA.items()}
+    else:
+        actual = {name: str(dtype) for name, dtype in data.dtypes.items()}
+        expected = DATASET_SCHEMA
+    return {
+        "missing": [name for name in DATASET_SCHEMA if name not in actual],
+        "untyped": {name: str(actual[name]) for name in DATASET_SCHEMA
+                    if name in actual and actual[name] != expected[name]},
+    }
+
+
+class MissingColumnsError(ValueError):
+    # Data entering the app lacks a column a chart needs (see check_columns)
+    pass
+
+
+def check_columns(available, columns, optional=()):
+    # The columns to read from data entering the app: all of `columns`,
+    # raising when one is missing, plus the `optional` ones it has. The
+    # builders rely on this check instead of testing for columns themselves.
+    missing = [c for c in columns if c not in available]
+    if missing:
+        raise MissingColumnsError(f"Columns {missing} not found in data.")
+    return list(columns) + [c for c in optional if c in available and c not in columns]
+
+
+def _warn_schema(path, schema):
+    if schema["missing"]:
+        print(f"[dataStore] {path}: missing columns {', '.join(schema['missing'])}", flush=True)
+    if schema["untyped"]:
+        untyped = ", ".join(f"{name} ({dtype})" for name, dtype in schema["untyped"].items())
+        print(f"[dataStore] {path}: columns not matching the schema, kept as read: {untyped}", flush=True)
+
+
+# Process-wide caches shared by every Streamlit session.
+# _datasets: absolute csv path -> {"stat", "fingerprint", "table", "frames", "ends_with_newline", "schema"}
+#   table is the memory-mapped sidecar (None without pyarrow) and frames holds
+#   the full pandas frame under None once materialized; column projections
+#   are views of it, built per call and never kept
+#   ends_with_newline tells whether later bytes can be a pure row append
+#   schema is the _validate result of the loaded data
+# _derived: (fingerprint, name) -> anything built from that dataset version
+# _mergers: derived name (without its ":" suffix) -> merge(value, delta_frame)
+#   used to fold appended rows into a derived value instead of rebuilding it
+# _daily: _derived key -> day, for values that depend on today's date
+# _uploads: content hash -> stored upload path, most recently used last
+# _upload_ids: Streamlit upload file_id -> content hash, so reruns skip hashing
+_lock = threading.RLock()
+_datasets = {}
+_derived = {}
+_mergers = {}
+_daily = {}
+_uploads = OrderedDict()
+_upload_ids = {}
+_frame_fingerprints = {}  # id(frame) -> (weakref to a frame handed out by load_dataset, fingerprint)
+
+
+@contextmanager
+def atomic_write(path):
+    # Yields a temporary path next to `path` and renames it over `path` once
+    # the block succeeds, so readers never see a partial file
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _file_stat(path):
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _scan_file(path, prefix_size=None):
+    # One pass over the file returning (content hash, hash of the first
+    # prefix_size bytes or None, whether the file ends with a newline)
+    digest = hashlib.blake2b(digest_size=16)
+    prefix_digest = None
+    position = 0
+    last_chunk = b""
+    with open(path, "rb") as f:
+        while True:
+            size = HASH_CHUNK_SIZE
+            if prefix_size is not None and position < prefix_size:
+                size = min(size, prefix_size - position)
+            chunk = f.read(size)
+            if not chunk:
+                break
+            digest.update(chunk)
+            position += len(chunk)
+            last_chunk = chunk
+            if position == prefix_size:
+                prefix_digest = digest.copy().hexdigest()
+    return digest.hexdigest(), prefix_digest, last_chunk.endswith(b"\n")
+
+
+def file_fingerprint(path):
+    # Content hash of the file, read in bounded chunks
+    return _scan_file(path)[0]
+
+
+def _drop_unreferenced_derived():
+    live = {entry["fingerprint"] for entry in _datasets.values()} | set(_uploads)
+    for key in [key for key in _derived if key[0] not in live]:
+        del _derived[key]
+    for key in [key for key in _daily if key not in _derived]:
+        del _daily[key]
+
+
+def sidecar_path(path):
+    return os.path.splitext(os.path.abspath(path))[0] + SIDECAR_SUFFIX
+
+
+def _sidecar_fingerprint(sidecar):
+    try:
+        with pa.memory_map(sidecar) as source:
+            metadata = pa.ipc.open_file(source).schema.metadata or {}
+    except (OSError, pa.ArrowInvalid):
+        return None
+    value = metadata.get(SIDECAR_FINGERPRINT_KEY)
+    if not value or metadata.get(SIDECAR_SCHEMA_KEY) != SCHEMA_VERSION.encode():
+        return None
+    return value.decode()
+
+
+def _write_sidecar(table, sidecar, fingerprint):
+    # IPC files allow a single dictionary per column
+    table = table.combine_chunks()
+    metadata = dict(table.schema.metadata or {})
+    metadata[SIDECAR_FINGERPRINT_KEY] = fingerprint.encode()
+    metadata[SIDECAR_SCHEMA_KEY] = SCHEMA_VERSION.encode()
+    table = table.replace_schema_metadata(metadata)
+    with atomic_write(sidecar) as tmp_path:
+        with pa.OSFile(tmp_path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+
+
+def _sort_dictionaries(table):
+    # Sorted dictionaries give categoricals the same group order as plain strings
+    for i, field in enumerate(table.schema):
+        if not pa.types.is_dictionary(field.type):
+            continue
+        values = table.column(i).cast(field.type.value_type).combine_chunks()
+        dictionary = pa_compute.unique(values).drop_null().sort()
+        indices = pa_compute.index_in(values, value_set=dictionary).cast(field.type.index_type)
+        table = table.set_column(i, field, pa.DictionaryArray.from_arrays(indices, dictionary))
+    return table
+
+
+def _read_typed_csv(path):
+    column_types = {name: _arrow_type(dtype) for name, dtype in DATASET_SCHEMA.items()}
+    table = pa_csv.read_csv(path, convert_options=pa_csv.ConvertOptions(column_types=column_types))
+    return _sort_dictionaries(table)
+
+
+def convert_to_sidecar(path, fingerprint=None):
+    # Convert the csv into an Arrow IPC file with the typed DATASET_SCHEMA
+    fingerprint = fingerprint or file_fingerprint(path)
+    sidecar = sidecar_path(path)
+    _write_sidecar(_read_typed_csv(path), sidecar, fingerprint)
+    return sidecar
+
+
+def _open_sidecar(path, fingerprint):
+    # Memory-map the sidecar, rebuilding it first when the csv has changed.
+    # Returns None when the csv does not fit the typed schema.
+    sidecar = sidecar_path(path)
+    if _sidecar_fingerprint(sidecar) != fingerprint:
+        try:
+            table = _read_typed_csv(path)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            return None
+        try:
+            _write_sidecar(table, sidecar, fingerprint)
+        except OSError:
+            # Read-only data directory, keep the typed table in memory instead
+            return table
+    return pa.ipc.open_file(pa.memory_map(sidecar)).read_all()
+
+
+def _to_frame(table):
+    if not SHARED_DATASET:
+        return table.to_pandas()
+    strings = pd.StringDtype("pyarrow", na_value=float("nan"))
+    return table.to_pandas(split_blocks=True, types_mapper={pa.string(): strings, pa.large_string(): strings}.get)
+
+
+def _entry_columns(entry):
+    return entry["table"].column_names if entry["table"] is not None else list(entry["frames"][None].columns)
+
+
+def _project(entry, columns, optional=()):
+    # Frame with only the requested columns. The full frame is materialized
+    # once per dataset version and every projection is a view of it, so the
+    # process holds one copy of the data whatever column sets are asked for.
+    full = entry["frames"].get(None)
+    if full is None:
+        full = entry["frames"][None] = _to_frame(entry["table"])
+    if columns is None:
+        frame = full
+    else:
+        # full[columns] would copy; a frame over the same Series does not
+        columns = check_columns(_entry_columns(entry), columns, optional)
+        frame = pd.DataFrame({c: full[c] for c in columns}, copy=False)
+    _remember_frame(frame, entry["fingerprint"])
+    return frame
+
+
+def _remember_frame(frame, fingerprint):
+    # Record the dataset version of a handed-out frame until it is collected
+    key = id(frame)
+
+    def forget(ref):
+        if _frame_fingerprints.get(key, (None,))[0] is ref:
+            _frame_fingerprints.pop(key, None)
+    _frame_fingerprints[key] = (weakref.ref(frame, forget), fingerprint)
+
+
+def with_columns(frame, **columns):
+    # frame plus extra (or replaced) columns. The existing columns are shared,
+    # not copied, which DataFrame.assign does not guarantee for split blocks.
+    data = {c: frame[c] for c in frame.columns}
+    data.update(columns)
+    return pd.DataFrame(data, index=frame.index, copy=False)
+
+
+def register_merge(name, merge):
+    # merge(value, delta_frame) returns the derived value for the dataset with
+    # delta_frame appended; it must equal a cold rebuild on the whole data
+    _mergers[name] = merge
+
+
+def _read_appended_rows(path, entry):
+    # Parse only the bytes appended since the entry was loaded
+    with open(path, "rb") as f:
+        f.seek(entry["stat"][1])
+        tail = f.read()
+    if entry["table"] is not None:
+        schema = entry["table"].schema.remove_metadata()
+        delta_table = pa_csv.read_csv(
+            io.BytesIO(tail),
+            read_options=pa_csv.ReadOptions(column_names=schema.names),
+            convert_options=pa_csv.ConvertOptions(column_types={field.name: field.type for field in schema}),
+        )
+        return delta_table.cast(schema), tail
+    columns = entry["frames"][None].columns
+    return typed_frame(pd.read_csv(io.BytesIO(tail), header=None, names=columns)), tail
+
+
+@timed
+def _apply_append(path, entry, stat, fingerprint):
+    # Extend the cached dataset with the appended rows and fold them into every
+    # derived value that has a registered merge; the rest is rebuilt lazily
+    try:
+        delta, tail = _read_appended_rows(path, entry)
+    except ValueError:  # also covers pyarrow.ArrowInvalid
+        return None
+
+    if entry["table"] is not None:
+        table = _sort_dictionaries(pa.concat_tables([entry["table"].replace_schema_metadata(None), delta]))
+        try:
+            sidecar = sidecar_path(path)
+            _write_sidecar(table, sidecar, fingerprint)
+            table = pa.ipc.open_file(pa.memory_map(sidecar)).read_all()
+        except OSError:
+            pass
+        frames = {}
+        delta = _to_frame(delta)
+    else:
+        table = None
+        # Categoricals with different categories concatenate to strings
+        frames = {None: typed_frame(pd.concat([entry["frames"][None], delta], ignore_index=True))}
+
+    for (key_fingerprint, name), value in list(_derived.items()):
+        merge = _mergers.get(name.split(":")[0])
+        if key_fingerprint == entry["fingerprint"] and merge is not None:
+            _derived[(fingerprint, name)] = merge(value, delta)
+            if (key_fingerprint, name) in _daily:
+                _daily[(fingerprint, name)] = _daily[(key_fingerprint, name)]
+
+    return {
+        "stat": stat,
+        "fingerprint": fingerprint,
+        "table": table,
+        "frames": frames,
+        "ends_with_newline": tail.endswith(b"\n"),
+        "schema": _validate(table if table is not None else frames[None]),
+    }
+
+
+def _current_entry(path):
+    # Parse the csv once per process and hand out the same entry afterwards.
+    # Its frames are shared across sessions, so callers must treat them as read-only.
+    # mtime/size are checked on every call; the content hash is only recomputed
+    # when they change, and the file is only re-parsed when the hash changes.
+    # With pyarrow installed the data is read from a memory-mapped columnar
+    # sidecar.
+    # When the file only grew by whole rows (its old bytes hash to the old
+    # fingerprint), only the new rows are parsed and folded into the caches.
+    # Each parsed version is validated against DATASET_SCHEMA once, here.
+    path = os.path.abspath(path)
+    stat = _file_stat(path)
+    with _lock:
+        entry = _datasets.get(path)
+        if entry is not None and entry["stat"] == stat:
+            return entry
+
+        appended = entry is not None and entry["ends_with_newline"] and stat[1] > entry["stat"][1]
+        fingerprint, prefix_fingerprint, ends_with_newline = _scan_file(
+            path, entry["stat"][1] if appended else None)
+        if entry is not None and entry["fingerprint"] == fingerprint:
+            entry["stat"] = stat
+            return entry
+
+        new_entry = None
+        if appended and prefix_fingerprint == entry["fingerprint"]:
+            new_entry = _apply_append(path, entry, stat, fingerprint)
+        if new_entry is None:
+            with span("dataStore.parse_dataset"):
+                # Stored uploads are parsed without a sidecar, so nothing but
+                # the upload itself is written to UPLOAD_DIR
+                table = _open_sidecar(path, fingerprint) if pa is not None and not is_stored_upload(path) else None
+                frames = {} if table is not None else {None: typed_frame(pd.read_csv(path))}
+            new_entry = {
+                "stat": stat,
+                "fingerprint": fingerprint,
+                "table": table,
+                "frames": frames,
+                "ends_with_newline": ends_with_newline,
+                "schema": _validate(table if table is not None else frames[None]),
+            }
+            _warn_schema(path, new_entry["schema"])
+        _datasets[path] = new_entry
+        _drop_unreferenced_derived()
+        if diskCache.enabled():
+            diskCache.prune({entry["fingerprint"] for entry in _datasets.values()})
+        return new_entry
+
+
+@timed
+def load_dataset(path=DEFAULT_CSV_PATH, columns=None, optional=()):
+    # Shared read-only frame of the csv; only the requested columns (and the
+    # optional ones the csv has) are materialized (see _current_entry for
+    # caching and invalidation)
+    entry = _current_entry(path)
+    with _lock:
+        return _project(entry, columns, optional)
+
+
+def path_fingerprint(path=DEFAULT_CSV_PATH):
+    # Fingerprint of the current csv contents, loading it if needed. Stored
+    # uploads are named after their content hash and are never loaded here.
+    if is_stored_upload(path):
+        return upload_fingerprint(path)
+    return _current_entry(path)["fingerprint"]
+
+
+def schema_report(path=DEFAULT_CSV_PATH):
+    # DATASET_SCHEMA check of the loaded csv: {"missing": [...], "untyped": {column: type}}
+    return _current_entry(path)["schema"]
+
+
+def missing_columns(path, columns):
+    # The `columns` a csv lacks, looked up once per dataset version: in the
+    # load entry, or in the header of a stored upload (which the Dashboard
+    # streams instead of loading)
+    if is_stored_upload(path):
+        available = derived("upload_header", upload_fingerprint(path),
+                            lambda: tuple(pd.read_csv(path, nrows=0).columns), persist=False)
+    else:
+        available = _entry_columns(_current_entry(path))
+    return [c for c in columns if c not in available]
+
+
+def column_memory_report(path=DEFAULT_CSV_PATH):
+    # Deep memory per column of a plain pd.read_csv next to the typed frame
+    # load_dataset hands out, largest saving first. Parses the csv again.
+    default = pd.read_csv(path)
+    typed = load_dataset(path)
+    report = pd.DataFrame({
+        "default_dtype": default.dtypes.astype(str),
+        "default_bytes": default.memory_usage(index=False, deep=True),
+        "typed_dtype": typed.dtypes.astype(str),
+        "typed_bytes": typed.memory_usage(index=False, deep=True),
+    }).loc[default.columns]
+    report["saved_bytes"] = report["default_bytes"] - report["typed_bytes"]
+    report["saved_pct"] = 100 * report["saved_bytes"] / report["default_bytes"]
+    return report.rename_axis("column").reset_index().sort_values("saved_bytes", ascending=False, ignore_index=True)
+
+
+def is_loaded(path=DEFAULT_CSV_PATH):
+    # Whether the cached copy of the csv is current, without loading it
+    path = os.path.abspath(path)
+    with _lock:
+        entry = _datasets.get(path)
+    try:
+        return entry is not None and entry["stat"] == _file_stat(path)
+    except OSError:
+        return False
+
+
+def has_derived(name, fingerprint, daily=False):
+    # Whether derived(name, fingerprint, ..., daily=daily) is in memory;
+    # a daily value only counts for today
+    if daily:
+        name = f"{name}:{pd.Timestamp.now().date().isoformat()}"
+    with _lock:
+        return (fingerprint, name) in _derived
+
+
+def dataset_fingerprint(frame):
+    # Fingerprint of a frame handed out by load_dataset, None for any other
+    # frame and for frames of a dataset version that is no longer loaded
+    ref, fingerprint = _frame_fingerprints.get(id(frame), (None, None))
+    if ref is None or ref() is not frame:
+        return None
+    with _lock:
+        live = any(entry["fingerprint"] == fingerprint for entry in _datasets.values())
+    return fingerprint if live else None
+
+
+def _remember_upload(fingerprint, path, file_id):
+    with _lock:
+        _uploads[fingerprint] = path
+        _uploads.move_to_end(fingerprint)
+        if file_id is not None:
+            _upload_ids[file_id] = fingerprint
+        while len(_uploads) > MAX_LIVE_UPLOADS:
+            evicted, evicted_path = _uploads.popitem(last=False)
+            _datasets.pop(evicted_path, None)
+            for key in [key for key, value in _upload_ids.items() if value == evicted]:
+                del _upload_ids[key]
+            _drop_unreferenced_derived()
+
+
+def _touch(path):
+    # Mark a stored upload as recently used (see UPLOAD_CACHE_MB); False
+    # when it is gone
+    try:
+        os.utime(path)
+    except OSError:
+        return False
+    return True
+
+
+def store_upload(source):
+    # Copy an uploaded file-like object into UPLOAD_DIR under its content hash,
+    # hashing and writing it in bounded chunks. Identical uploads share one
+    # file, so every derived value is reused across reruns and sessions.
+    # Returns (path, fingerprint).
+    file_id = getattr(source, "file_id", None)
+    with _lock:
+        fingerprint = _upload_ids.get(file_id) if file_id is not None else None
+        path = _uploads.get(fingerprint)
+    if path is not None and _touch(path):
+        _remember_upload(fingerprint, path, file_id)
+        return path, fingerprint
+
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    digest = hashlib.blake2b(digest_size=16)
+    tmp_path = os.path.join(UPLOAD_DIR, f".{os.getpid()}.{threading.get_ident()}.tmp")
+    source.seek(0)
+    try:
+        with open(tmp_path, "wb") as f:
+            while True:
+                chunk = source.read(HASH_CHUNK_SIZE)
+                if not chunk:
+                    break
+                if isinstance(chunk, str):
+                    chunk = chunk.encode()
+                digest.update(chunk)
+                f.write(chunk)
+        fingerprint = digest.hexdigest()
+        path = os.path.join(UPLOAD_DIR, f"{fingerprint}.csv")
+        if not _touch(path):
+            os.replace(tmp_path, path)
+    finally:
+        source.seek(0)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    _remember_upload(fingerprint, path, file_id)
+    with _lock:
+        live = set(_uploads)
+    diskCache.prune(live, directory=UPLOAD_DIR, max_entries=None, max_bytes=UPLOAD_CACHE_MB * 1024 * 1024)
+    return path, fingerprint
+
+
+def is_stored_upload(source):
+    # Whether a csv path points into the upload cache
+    return isinstance(source, str) and os.path.dirname(os.path.abspath(source)) == os.path.abspath(UPLOAD_DIR)
+
+
+def upload_fingerprint(path):
+    # Content hash of a stored upload, from its file name (see store_upload)
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def load_source(source, columns=None, optional=()):
+    # Accept a csv path, an uploaded file-like object or an already-loaded frame.
+    # Returns (frame, fingerprint); fingerprint is None when the data is not cached.
+    # Frames may carry extra columns but must hold `columns` (see
+    # check_columns for `optional`); frames not
+    # handed out by load_dataset get the DATASET_SCHEMA dtypes. Uploads are
+    # stored by content hash and then loaded like any csv path.
+    if isinstance(source, pd.DataFrame):
+        fingerprint = dataset_fingerprint(source)
+        if fingerprint is None:
+            check_columns(source.columns, columns or (), optional)
+            source = typed_frame(source)
+        return source, fingerprint
+    if hasattr(source, "read"):
+        source = store_upload(source)[0]
+    frame = load_dataset(source, columns, optional)
+    return frame, dataset_fingerprint(frame)
+
+
+def _drop_other_days(day):
+    for key in [key for key, key_day in _daily.items() if key_day != day]:
+        del _daily[key]
+        _derived.pop(key, None)
+
+
+def derived(name, fingerprint, build, persist=True, daily=False):
+    # Memoize build() per dataset version; uncached data is always rebuilt.
+    # With the disk cache enabled, persist=True values are also shared with
+    # every process using the same cache directory (see diskCache).
+    # daily=True values depend on today's date: they are keyed by name and
+    # day, and the first one built on a new day evicts every earlier day's.
+    if fingerprint is None:
+        return build()
+    day = pd.Timestamp.now().date().isoformat() if daily else None
+    if daily:
+        name = f"{name}:{day}"
+    key = (fingerprint, name)
+    with _lock:
+        if key in _derived:
+            return _derived[key]
+        if daily:
+            _drop_other_days(day)
+    if persist and diskCache.enabled():
+        if daily:
+            diskCache.prune_days(fingerprint, day)
+        value = diskCache.get_or_build(fingerprint, name, build, day)
+    else:
+        value = build()
+    with _lock:
+        if daily:
+            _daily[key] = day
+        return _derived.setdefault(key, value)
+
+
+if __name__ == "__main__":
+    # python dataStore.py [csv]: schema check and memory saved per column
+    import sys
+
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_CSV_PATH
+    print(f"schema: {schema_report(csv_path)}")
+    report = column_memory_report(csv_path)
+    print(report.to_string(index=False, float_format=lambda value: f"{value:.1f}"))
+    default_total, typed_total = report["default_bytes"].sum(), report["typed_bytes"].sum()
+    print(f"total: {default_total / 2 ** 20:.2f} MB -> {typed_total / 2 ** 20:.2f} MB "
+          f"({100 * (1 - typed_total / default_total):.1f}% saved)")
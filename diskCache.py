@@ -0,0 +1,145 @@
+import hashlib
+import os
+import pickle
+import re
+import shutil
+from contextlib import contextmanager
+
+import dataStore
+
+try:
+    import fcntl
+except ImportError:  # no advisory locks (Windows), writes are still atomic
+    fcntl = None
+
+# NEXUS_DERIVED_CACHE=disk also stores derived values (KPIs, rollups, indexes,
+# figures) under NEXUS_DERIVED_CACHE_DIR, one directory per dataset version.
+# Replicas sharing that directory reuse each other's work: a value is built
+# once per dataset version, by whichever process takes its lock first.
+# Values that depend on today's date live in a per-day subdirectory that is
+# removed once a value of a later day is stored.
+DERIVED_CACHE = os.environ.get("NEXUS_DERIVED_CACHE", "memory")
+DERIVED_CACHE_DIR = os.environ.get(
+    "NEXUS_DERIVED_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "Data", "derived_cache"),
+)
+# Dataset versions kept on disk, most recently used first
+MAX_CACHED_VERSIONS = 4
+
+
+def enabled():
+    return DERIVED_CACHE == "disk"
+
+
+DAILY_PREFIX = "daily-"
+
+
+def _entry_path(fingerprint, name, day=None):
+    readable = re.sub(r"[^A-Za-z0-9_.-]", "_", name)[:80]
+    digest = hashlib.blake2b(name.encode(), digest_size=8).hexdigest()
+    directory = os.path.join(DERIVED_CACHE_DIR, fingerprint)
+    if day is not None:
+        directory = os.path.join(directory, DAILY_PREFIX + day)
+    return os.path.join(directory, f"{readable}-{digest}.pkl")
+
+
+def _read(path):
+    try:
+        with open(path, "rb") as f:
+            return True, pickle.load(f)
+    except FileNotFoundError:
+        return False, None
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return False, None  # unreadable or from an incompatible version, rebuild
+
+
+def _write(path, value):
+    with dataStore.atomic_write(path) as tmp_path:
+        with open(tmp_path, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+@contextmanager
+def _locked(path):
+    # Exclusive advisory lock shared by every process on this volume
+    with open(f"{path}.lock", "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def get_or_build(fingerprint, name, build, day=None):
+    # The stored value, or build() it under the entry's lock and store it.
+    # Values that cannot be pickled are returned without being stored.
+    # day files the value under that day (see prune_days).
+    path = _entry_path(fingerprint, name, day)
+    found, value = _read(path)
+    if found:
+        return value
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    except OSError:
+        return build()  # read-only volume, behave like the memory cache
+    with _locked(path):
+        # Another process may have built it while this one waited
+        found, value = _read(path)
+        if found:
+            return value
+        value = build()
+        try:
+            _write(path, value)
+        except (OSError, pickle.PicklingError, TypeError, AttributeError):
+            pass
+    return value
+
+
+def prune_days(fingerprint, day):
+    # Drop the dataset version's daily values of every day but `day`
+    try:
+        entries = list(os.scandir(os.path.join(DERIVED_CACHE_DIR, fingerprint)))
+    except OSError:
+        return
+    for entry in entries:
+        if entry.is_dir() and entry.name.startswith(DAILY_PREFIX) and entry.name != DAILY_PREFIX + day:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def _entry_bytes(entry):
+    if not entry.is_dir():
+        return entry.stat().st_size
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(entry.path) for name in names)
+
+
+def prune(keep_fingerprints=(), directory=DERIVED_CACHE_DIR, max_entries=MAX_CACHED_VERSIONS, max_bytes=None):
+    # Drop the least recently modified entries of `directory` (dataset
+    # version directories, or files named <fingerprint>.<ext>) beyond the
+    # max_entries newest ones and beyond max_bytes in total. Entries of
+    # keep_fingerprints are never dropped, and neither are in-progress
+    # writes (names starting with ".").
+    try:
+        entries = [entry for entry in os.scandir(directory) if not entry.name.startswith(".")]
+        entries.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+    except OSError:
+        return
+    total = 0
+    for index, entry in enumerate(entries):
+        try:
+            size = _entry_bytes(entry) if max_bytes is not None else 0
+        except OSError:
+            continue
+        if os.path.splitext(entry.name)[0] in keep_fingerprints:
+            total += size
+        elif (max_entries is not None and index >= max_entries) or (max_bytes is not None and total + size > max_bytes):
+            if entry.is_dir():
+                shutil.rmtree(entry.path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+        else:
+            total += size
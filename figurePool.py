@@ -0,0 +1,108 @@
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# NEXUS_FIGURE_WORKERS > 0 prebuilds the Dashboard figures concurrently on a
+# thread pool of that size; 0 builds them one after another in the script
+# thread. Threads rather than processes: the builders spend their time in
+# pandas/numpy kernels that release the GIL, they share the process-wide
+# dataset caches, and a spawned process would re-execute the Streamlit script.
+FIGURE_WORKERS = int(os.environ.get("NEXUS_FIGURE_WORKERS", "0"))
+
+# Most recent task timings, newest last
+TIMING_HISTORY = 500
+
+_lock = threading.Lock()
+_executor = None
+_timings = deque(maxlen=TIMING_HISTORY)
+_batches = itertools.count(1)
+
+
+def pool_enabled():
+    return FIGURE_WORKERS > 0
+
+
+def _get_executor():
+    # One pool per process, shared by every session
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(FIGURE_WORKERS, thread_name_prefix="nexus-figure")
+        return _executor
+
+
+def _timed(work, args):
+    # Runs on a worker; returns the result with its build time
+    start = time.perf_counter()
+    result = work(*args)
+    return result, time.perf_counter() - start
+
+
+def new_batch():
+    # Id grouping the tasks submitted for one script run (see batch_timings)
+    return next(_batches)
+
+
+def _record(task, param, batch, submitted, future):
+    try:
+        _, seconds = future.result()
+    except Exception:
+        seconds = None
+    finished = time.perf_counter()
+    with _lock:
+        _timings.append({
+            "batch": batch,
+            "task": task,
+            "param": param,
+            "workers": FIGURE_WORKERS,
+            "build_seconds": seconds,
+            "wall_seconds": finished - submitted,
+            "submitted": submitted,
+            "finished": finished,
+        })
+
+
+def submit(task, param, work, *args, batch=None):
+    # Start work(*args) on the pool; returns the (param, future) pair that
+    # resolve() looks up
+    submitted = time.perf_counter()
+    future = _get_executor().submit(_timed, work, args)
+    future.add_done_callback(lambda done: _record(task, param, batch, submitted, done))
+    return param, future
+
+
+def resolve(prefetched, task, param, build):
+    # The prefetched result of `task` when it was submitted for `param`,
+    # otherwise build() inline (e.g. a fragment rerun with a new selection).
+    # A prefetched result is handed out once.
+    entry = prefetched.pop(task, None) if prefetched else None
+    if entry is not None and entry[0] == param:
+        return entry[1].result()[0]
+    return build()
+
+
+def task_timings():
+    # Timings of the most recent pool tasks, oldest first
+    with _lock:
+        return list(_timings)
+
+
+def batch_timings():
+    # Per batch of tasks: the wall time from the first submit to the last
+    # result next to the slowest and the summed build times. With enough
+    # workers the wall time is close to the slowest build, not to the sum.
+    batches = {}
+    for timing in task_timings():
+        if timing["batch"] is not None:
+            batches.setdefault(timing["batch"], []).append(timing)
+    return [{
+        "batch": batch,
+        "tasks": len(timings),
+        "workers": timings[0]["workers"],
+        "wall_seconds": max(t["finished"] for t in timings) - min(t["submitted"] for t in timings),
+        "slowest_build_seconds": max(t["build_seconds"] or 0.0 for t in timings),
+        "total_build_seconds": sum(t["build_seconds"] or 0.0 for t in timings),
+    } for batch, timings in batches.items()]
@@ -0,0 +1,37 @@
+import functools
+import os
+import time
+
+import streamlit as st
+
+from perfSpans import PERF_SPANS, record
+
+# NEXUS_FRAGMENT_TRACE=1 prints every fragment run to the server log
+FRAGMENT_TRACE = os.environ.get("NEXUS_FRAGMENT_TRACE", "0") == "1"
+
+
+def traced_fragment(name):
+    # st.fragment that counts its runs in st.session_state["fragment_runs"],
+    # so a widget interaction shows exactly which fragments re-executed
+    def decorate(func):
+        @st.fragment
+        @functools.wraps(func)
+        def run(*args, **kwargs):
+            runs = st.session_state.setdefault("fragment_runs", {})
+            runs[name] = runs.get(name, 0) + 1
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                seconds = time.perf_counter() - start
+                if PERF_SPANS:
+                    record(f"fragment:{name}", seconds)
+                if FRAGMENT_TRACE:
+                    print(f"[fragment] {name} run {runs[name]} in {seconds:.3f}s", flush=True)
+        return run
+    return decorate
+
+
+def fragment_runs():
+    # Runs per fragment in the current session
+    return dict(st.session_state.get("fragment_runs", {}))
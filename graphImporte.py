@@ -1,6 +1,9 @@
 import os
-import pandas as pd
 import plotly.graph_objects as go
+from dataStore import IMPORTE_SCALE, load_source, derived, register_merge
+from perfSpans import timed
+import sqlBackend
+from uploadStream import is_streamed, fold_upload
 
 color_palette = {
     "nx1" : "#401f71",
@@ -15,21 +18,84 @@ color_palette = {
     "nx10": "#d9ccef"
 }
 
+IMPORTE_COLUMNS = ['quarter', 'month', 'total_importe']
+# Rows of a csv without a year column count under "All" only
+IMPORTE_OPTIONAL_COLUMNS = ['year']
+
+
+@timed
+def build_importe_rollup(aggregated_df):
+    # Sum, count and mean of total_importe keyed by (year, quarter, month).
+    # NaN keys are kept so that "All" still covers rows without a year.
+    # Sums are accumulated in integer cents so that merged batches are exact.
+    cents = (aggregated_df['total_importe'] * IMPORTE_SCALE).round()
+    # Without a year column every row gets a NaN year
+    year = aggregated_df['year'] if 'year' in aggregated_df.columns else aggregated_df.reindex(columns=['year'])['year']
+    keys = [year, aggregated_df['quarter'], aggregated_df['month']]
+    rollup = cents.groupby(keys, dropna=False).agg(['sum', 'count'])
+    rollup = rollup.rename(columns={'sum': 'sum_cents'})
+    return _finish_rollup(rollup)
+
+
+def _finish_rollup(rollup):
+    rollup['sum'] = rollup['sum_cents'] / IMPORTE_SCALE
+    rollup['mean'] = rollup['sum'] / rollup['count']
+    return rollup
+
+
+@timed
+def merge_importe_rollup(rollup, delta_df):
+    # Fold appended rows into an existing rollup
+    delta = build_importe_rollup(delta_df)
+    merged = rollup[['sum_cents', 'count']].add(delta[['sum_cents', 'count']], fill_value=0)
+    merged['count'] = merged['count'].astype('int64')
+    return _finish_rollup(merged.sort_index())
+
+
+register_merge("importe_rollup", merge_importe_rollup)
+
+
+@timed
+def get_sql_importe_rollup(path, year="All"):
+    # Rollup cube grouped (and filtered by year) in the SQL backend
+    return derived(f"importe_rollup_sql:{year}", sqlBackend.database_fingerprint(path), lambda: _finish_rollup(
+        sqlBackend.importe_rollup(path, None if year == "All" else year)))
+
+
+@timed
+def get_importe_rollup(uploaded_file):
+    # Rollup cube built once per dataset version
+    if sqlBackend.use_sql(uploaded_file):
+        return get_sql_importe_rollup(uploaded_file)
+    if is_streamed(uploaded_file):
+        # Uploads are folded into the rollup chunk by chunk
+        return fold_upload(uploaded_file, "importe_rollup_stream", IMPORTE_COLUMNS, build_importe_rollup,
+                           merge_importe_rollup, optional=IMPORTE_OPTIONAL_COLUMNS)
+    aggregated_df, fingerprint = load_source(uploaded_file, columns=IMPORTE_COLUMNS, optional=IMPORTE_OPTIONAL_COLUMNS)
+    return derived("importe_rollup", fingerprint, lambda: build_importe_rollup(aggregated_df))
+
+
+@timed
+def get_importe_years(uploaded_file):
+    # Years with rows, read off the rollup instead of the dataset
+    years = get_importe_rollup(uploaded_file).index.get_level_values('year')
+    return sorted(int(year) for year in years.dropna().unique())
+
+
+@timed
 def get_importe_plotly_figure(uploaded_file, year="All", height=500, width=900):
-    # Accept both file path and uploaded file-like object
-    if hasattr(uploaded_file, "read"):
-        uploaded_file.seek(0)
-        aggregated_df = pd.read_csv(uploaded_file)
-        uploaded_file.seek(0)
+    # Accept a file path, an uploaded file-like object or an already-loaded frame
+    if sqlBackend.use_sql(uploaded_file):
+        rollup = get_sql_importe_rollup(uploaded_file, year)
     else:
-        aggregated_df = pd.read_csv(uploaded_file)
+        rollup = get_importe_rollup(uploaded_file)
 
-    # Filter by year if not "All"
-    if year != "All":
-        aggregated_df = aggregated_df[aggregated_df['year'] == int(year)].copy()
+        # Slice the cube by year if not "All"
+        if year != "All":
+            rollup = rollup[rollup.index.get_level_values('year') == int(year)]
 
     # If no data for selected year, return empty plot
-    if aggregated_df.empty:
+    if rollup.empty:
         fig = go.Figure()
         fig.update_layout(
             title=f"No data for year {year}",
@@ -38,15 +104,10 @@ def get_importe_plotly_figure(uploaded_file, year="All", height=500, width=900):
         )
         return fig
 
-    # Prepare labels and groupings
-    aggregated_df['quarter_label'] = 'Q' + aggregated_df['quarter'].astype(str)
-    aggregated_df['month_str'] = aggregated_df['month'].astype(str)
-    aggregated_df['x'] = aggregated_df['quarter_label'] + '-' + aggregated_df['month_str']
-
-    # Group by (quarter, month) and sum importe
-    monthly_group = aggregated_df.groupby(['quarter_label', 'month']).agg({
-        'total_importe': 'sum'
-    }).reset_index()
+    # Sum the cube over years to get the (quarter, month) totals
+    monthly_group = rollup.groupby(level=['quarter', 'month'])['sum'].sum().reset_index()
+    monthly_group = monthly_group.rename(columns={'sum': 'total_importe'})
+    monthly_group['quarter_label'] = 'Q' + monthly_group['quarter'].astype(str)
     monthly_group['x'] = monthly_group['quarter_label'] + '-' + monthly_group['month'].astype(str)
     monthly_group = monthly_group.sort_values(['quarter_label', 'month'])
 
@@ -2,6 +2,11 @@ import pandas as pd
 import calendar
 import numpy as np
 import plotly.graph_objects as go
+from dataStore import load_source, derived, register_merge
+from perfSpans import timed
+import sqlBackend
+from sketches import hll_registers, hll_merge, hll_count
+from uploadStream import is_streamed, fold_upload
 
 color_palette = {
     "nx1" : "#401f71",
@@ -16,40 +21,120 @@ color_palette = {
     "nx10": "#d9ccef"
 }
 
-def get_risk_plotly_figure(uploaded_file, year="All", height=500, width=900):
-    # Accept both file path and uploaded file-like object
-    if hasattr(uploaded_file, "read"):
-        uploaded_file.seek(0)
-        df = pd.read_csv(uploaded_file)
-        uploaded_file.seek(0)
+RISK_COLUMNS = ['month', 'riskclient']
+# Without a year column every row counts under "All" and no year is filtered
+RISK_OPTIONAL_COLUMNS = ['year']
+
+
+@timed
+def build_risk_counts(df):
+    # Dense [year, month, risk] count array built in one bincount pass.
+    # years labels the first axis (NaN years get their own slice so that "All"
+    # still counts them, None without a year column); month and risk are
+    # indexed by their own values.
+    if 'year' in df.columns:
+        year_codes, years = pd.factorize(df['year'], sort=True, use_na_sentinel=False)
+    else:
+        year_codes, years = np.zeros(len(df), dtype=np.int64), None
+
+    month = df['month'].to_numpy(dtype=float)
+    risk = df['riskclient'].to_numpy(dtype=float)
+    valid = (month >= 1) & (month <= 12) & (risk >= 0)
+    month = month[valid].astype(np.int64)
+    risk = risk[valid].astype(np.int64)
+    year_codes = year_codes[valid]
+
+    n_years, n_months = len(years) if years is not None else 1, 13
+    n_risk = max(2, int(risk.max()) + 1 if len(risk) else 2)
+    flat = (year_codes * n_months + month) * n_risk + risk
+    counts = np.bincount(flat, minlength=n_years * n_months * n_risk)
+    return counts.reshape(n_years, n_months, n_risk), years
+
+
+@timed
+def merge_risk_counts(risk_counts, delta_df):
+    # Fold appended rows into an existing count tensor, aligning the year axes
+    counts, years = risk_counts
+    delta_counts, delta_years = build_risk_counts(delta_df)
+    if years is None:
+        merged_years = None
     else:
-        df = pd.read_csv(uploaded_file)
+        merged_years = pd.Index(years).union(pd.Index(delta_years)).sort_values()
+    n_risk = max(counts.shape[2], delta_counts.shape[2])
+    merged = np.zeros((len(merged_years) if merged_years is not None else 1, 13, n_risk), dtype=np.int64)
+    for part, part_years in ((counts, years), (delta_counts, delta_years)):
+        rows = merged_years.get_indexer(part_years) if merged_years is not None else [0]
+        merged[rows, :, :part.shape[2]] += part
+    return merged, merged_years
 
-    # Only filter if year is not None and not "All"
-    if 'year' in df.columns and year not in (None, "All"):
-        df = df[df['year'] == int(year)]
 
-    grouped = df.groupby(['month', 'riskclient']).size().unstack(fill_value=0).reset_index()
-    grouped.columns.name = None
+register_merge("risk_counts", merge_risk_counts)
 
-    if 0 not in grouped.columns:
-        grouped[0] = 0
-    if 1 not in grouped.columns:
-        grouped[1] = 0
 
-    grouped = grouped.rename(columns={0: 'risk_0', 1: 'risk_1'})
-    grouped['total'] = grouped['risk_0'] + grouped['risk_1']
-    grouped['risk_1_pct'] = (grouped['risk_1'] / grouped['total']) * 100
-    grouped['months'] = grouped['month'].apply(lambda x: calendar.month_abbr[x])
-    grouped = grouped.sort_values('month')
+@timed
+def build_risk_counts_from_groups(groups, years):
+    # The build_risk_counts tensor from (year, month, riskclient, n) group rows
+    year_codes = years.get_indexer(groups['year']) if years is not None else np.zeros(len(groups), dtype=np.int64)
+    risk = groups['riskclient'].to_numpy(dtype=np.int64)
+    n_risk = max(2, int(risk.max()) + 1 if len(risk) else 2)
+    counts = np.zeros((len(years) if years is not None else 1, 13, n_risk), dtype=np.int64)
+    np.add.at(counts, (year_codes, groups['month'].to_numpy(dtype=np.int64), risk), groups['n'].to_numpy())
+    return counts, years
 
-    months_str = grouped['months'].tolist()
+
+@timed
+def get_sql_risk_counts(path, year="All"):
+    # Count tensor grouped (and filtered by year) in the SQL backend
+    def build():
+        year_filter = None if year in (None, "All") else year
+        groups = sqlBackend.risk_month_counts(path, year_filter)
+        years = None
+        if 'year' in groups.columns:
+            years = pd.Index(sqlBackend.distinct_values(path, 'year', year=year_filter))
+        return build_risk_counts_from_groups(groups, years)
+    return derived(f"risk_counts_sql:{year}", sqlBackend.database_fingerprint(path), build)
+
+
+@timed
+def get_risk_counts(uploaded_file):
+    # Count tensor built once per dataset version
+    if sqlBackend.use_sql(uploaded_file):
+        return get_sql_risk_counts(uploaded_file)
+    if is_streamed(uploaded_file):
+        # Uploads are folded into the tensor chunk by chunk
+        return fold_upload(uploaded_file, "risk_counts_stream", RISK_COLUMNS, build_risk_counts, merge_risk_counts,
+                           optional=RISK_OPTIONAL_COLUMNS)
+    df, fingerprint = load_source(uploaded_file, columns=RISK_COLUMNS, optional=RISK_OPTIONAL_COLUMNS)
+    return derived("risk_counts", fingerprint, lambda: build_risk_counts(df))
+
+
+@timed
+def get_risk_plotly_figure(uploaded_file, year="All", height=500, width=900):
+    # Accept a file path, an uploaded file-like object or an already-loaded frame
+    if sqlBackend.use_sql(uploaded_file):
+        counts, years = get_sql_risk_counts(uploaded_file, year)
+    else:
+        counts, years = get_risk_counts(uploaded_file)
+
+    # A single year is one slice of the tensor, "All" sums over the year axis
+    if years is not None and year not in (None, "All"):
+        counts = counts[np.asarray(years == int(year))]
+    month_counts = counts.sum(axis=0)
+
+    months = np.flatnonzero(month_counts.sum(axis=1))
+    risk_0 = month_counts[months, 0]
+    risk_1 = month_counts[months, 1]
+    total = risk_0 + risk_1
+    with np.errstate(divide='ignore', invalid='ignore'):
+        risk_1_pct = (risk_1 / total) * 100
+
+    months_str = np.array(calendar.month_abbr)[months].tolist()
 
     fig = go.Figure()
 
     fig.add_trace(go.Bar(
         x=months_str,
-        y=grouped['risk_0'],
+        y=risk_0,
         name="Risk Client = 0",
         marker_color=color_palette["nx2"],
         hovertemplate='Month: %{x}<br>Risk Client: 0<br>Count: %{y}<extra></extra>'
@@ -57,7 +142,7 @@ def get_risk_plotly_figure(uploaded_file, year="All", height=500, width=900):
 
     fig.add_trace(go.Bar(
         x=months_str,
-        y=grouped['risk_1'],
+        y=risk_1,
         name="Risk Client = 1",
         marker_color=color_palette["nx3"],
         hovertemplate='Month: %{x}<br>Risk Client: 1<br>Count: %{y}<extra></extra>'
@@ -66,7 +151,7 @@ def get_risk_plotly_figure(uploaded_file, year="All", height=500, width=900):
     # Add line for percentage of risk 1
     fig.add_trace(go.Scatter(
         x=months_str,
-        y=grouped['risk_1_pct'],
+        y=risk_1_pct,
         name="Risk Client = 1 (%)",
         mode='lines+markers',
         yaxis='y2',
@@ -95,44 +180,217 @@ def get_risk_plotly_figure(uploaded_file, year="All", height=500, width=900):
 
     return fig
 
-def get_account_age_plotly_figure_by_affiliation(uploaded_file, year_range=None, height=400, width=600):
-    # Accept both file path and uploaded file-like object
-    if hasattr(uploaded_file, "read"):
-        uploaded_file.seek(0)
-        df = pd.read_csv(uploaded_file)
-        uploaded_file.seek(0)
+AGE_BINS = [0, 1, 3, np.inf]
+AGE_LABELS = ['< 1 year', '1-3 years', '> 3 years']
+ACCOUNT_AGE_COLUMNS = ['external_account_id', 'fecha_afiliacion']
+# A precomputed account_age_years column overrides the ages computed from
+# fecha_afiliacion
+ACCOUNT_AGE_OPTIONAL_COLUMNS = ['account_age_years']
+
+
+def _affiliation_ages(df, now):
+    # (affiliation dates, age bin codes with NaN for unbinned rows)
+    fecha_afiliacion = pd.to_datetime(df['fecha_afiliacion'])
+    if 'account_age_years' in df.columns:
+        account_age_years = df['account_age_years']
     else:
-        df = pd.read_csv(uploaded_file)
+        account_age_years = (now - fecha_afiliacion).dt.days / 365.25
+    return fecha_afiliacion, pd.cut(account_age_years, bins=AGE_BINS, labels=False, right=False).to_numpy()
+
+
+# Distinct (account, age bin, affiliation year) occurrences are kept as sorted
+# int64 keys (account code * bins + bin) * YEAR_SPAN + year, with NO_YEAR
+# standing for a missing affiliation date so it sorts last
+YEAR_SPAN = 10_000
+NO_YEAR = YEAR_SPAN - 1
+
+
+def _year_keys(years):
+    return pd.Series(years).fillna(NO_YEAR).to_numpy(dtype=np.int64)
+
+
+def _year_index(year_keys):
+    # Sorted affiliation years from their keys, NaN (no date) last
+    return pd.Index(year_keys).where(year_keys != NO_YEAR)
+
+
+def _occurrence_keys(account_codes, age_codes, year_keys):
+    valid = ~np.isnan(age_codes) & (account_codes >= 0)
+    groups = account_codes[valid] * len(AGE_LABELS) + age_codes[valid].astype(np.int64)
+    return np.unique(groups * YEAR_SPAN + year_keys[valid])
 
-    # Ensure fecha_afiliacion exists and parse year
-    if 'fecha_afiliacion' not in df.columns:
-        raise ValueError("Column 'fecha_afiliacion' not found in data.")
-    df['afiliacion_year'] = pd.to_datetime(df['fecha_afiliacion']).dt.year
 
-    # Filter by year range if provided
+def _occurrence_cells(keys, years):
+    # cells[bin, year, slot] of sorted occurrence keys, the slot being the
+    # previous occurrence of the same account and bin (0 = none, k = year
+    # index k - 1)
+    groups = keys // YEAR_SPAN
+    year_codes = pd.Index(_year_keys(years)).get_indexer(keys % YEAR_SPAN)
+    first = np.r_[True, groups[1:] != groups[:-1]]
+    slot = np.where(first, 0, np.r_[0, year_codes[:-1]] + 1)
+    n_bins, n_years = len(AGE_LABELS), len(years)
+    flat = ((groups % n_bins) * n_years + year_codes) * (n_years + 1) + slot
+    return np.bincount(flat, minlength=n_bins * n_years * (n_years + 1)).reshape(n_bins, n_years, n_years + 1)
+
+
+def _prefix_sums(cells):
+    prefix = np.zeros((cells.shape[0], cells.shape[1] + 1, cells.shape[2] + 1), dtype=np.int64)
+    prefix[:, 1:, 1:] = cells.cumsum(axis=1).cumsum(axis=2)
+    return prefix
+
+
+@timed
+def build_account_age_index(df, now):
+    # Distinct-account index over (affiliation year, age bin) answering any
+    # inclusive affiliation-year range in O(years x bins) without a rescan.
+    # An account is counted for a range at its first affiliation year inside
+    # the range, i.e. at each occurrence whose previous occurrence (same
+    # account and bin) lies before the range start. prefix holds the 2D
+    # cumulative sums of the occurrence cells (see _occurrence_cells).
+    fecha_afiliacion, age_codes = _affiliation_ages(df, now)
+    year_keys = _year_keys(fecha_afiliacion.dt.year)
+    account_codes, accounts = pd.factorize(df['external_account_id'])
+    occurrences = _occurrence_keys(account_codes, age_codes, year_keys)
+    years = _year_index(np.unique(year_keys))
+    prefix = _prefix_sums(_occurrence_cells(occurrences, years))
+    # The account ids and occurrence keys let appended rows be merged in
+    return {'years': years, 'prefix': prefix, 'accounts': accounts, 'occurrences': occurrences, 'now': now}
+
+
+@timed
+def merge_account_age_index(index, delta_df):
+    # Apply the delta's new occurrences to the cell counts: only the
+    # (account, bin) pairs they belong to are recounted, so the cost depends
+    # on the delta, not on the retained accounts
+    fecha_afiliacion, age_codes = _affiliation_ages(delta_df, index['now'])
+    year_keys = _year_keys(fecha_afiliacion.dt.year)
+    ids = delta_df['external_account_id']
+    account_codes = index['accounts'].get_indexer(ids)
+    new = (account_codes < 0) & ids.notna().to_numpy()
+    new_codes, new_accounts = pd.factorize(ids[new])
+    account_codes[new] = len(index['accounts']) + new_codes
+    accounts = index['accounts'].append(new_accounts)
+
+    old = index['occurrences']
+    keys = _occurrence_keys(account_codes, age_codes, year_keys)
+    keys = keys[np.append(old, -1)[np.searchsorted(old, keys)] != keys]
+
+    # Old cells moved onto the (possibly larger) year axis
+    years = _year_index(np.union1d(_year_keys(index['years']), year_keys))
+    moved = pd.Index(_year_keys(years)).get_indexer(_year_keys(index['years']))
+    cells = np.zeros((len(AGE_LABELS), len(years), len(years) + 1), dtype=np.int64)
+    cells[:, moved[:, None], np.r_[0, moved + 1][None, :]] = np.diff(np.diff(index['prefix'], axis=1), axis=2)
+
+    # Recount the touched (account, bin) pairs with their new occurrences
+    groups = np.unique(keys // YEAR_SPAN)
+    low, high = np.searchsorted(old, groups * YEAR_SPAN), np.searchsorted(old, (groups + 1) * YEAR_SPAN)
+    lengths = high - low
+    touched = old[np.repeat(low - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())]
+    cells -= _occurrence_cells(touched, years)
+    cells += _occurrence_cells(np.union1d(touched, keys), years)
+
+    occurrences = np.insert(old, np.searchsorted(old, keys), keys)
+    return {'years': years, 'prefix': _prefix_sums(cells), 'accounts': accounts, 'occurrences': occurrences,
+            'now': index['now']}
+
+
+register_merge("account_age_index", merge_account_age_index)
+
+
+@timed
+def build_account_age_sketch(df, now):
+    # Bounded-memory counterpart of the account-age index for streamed
+    # uploads: one HyperLogLog sketch of the account ids per (age bin,
+    # affiliation year) cell. A year range is the union of its cells, so
+    # counts are estimates (about 0.8% error) instead of exact.
+    fecha_afiliacion, age_codes = _affiliation_ages(df, now)
+    affiliation_year = fecha_afiliacion.dt.year
+    valid = ~np.isnan(age_codes) & df['external_account_id'].notna().to_numpy()
+    occurrences = pd.DataFrame({
+        'account': df['external_account_id'].to_numpy()[valid],
+        'age': age_codes[valid].astype(np.int64),
+        'year': affiliation_year.to_numpy()[valid],
+    })
+    cells = {}
+    for (age, year), accounts in occurrences.groupby(['age', 'year'], dropna=False)['account']:
+        cells[(int(age), None if pd.isna(year) else int(year))] = hll_registers(accounts)
+    years = pd.Index(affiliation_year.unique()).sort_values(na_position='last')
+    return {'years': years, 'cells': cells, 'now': now}
+
+
+@timed
+def merge_account_age_sketch(sketch, delta_df):
+    delta = build_account_age_sketch(delta_df, sketch['now'])
+    cells = dict(sketch['cells'])
+    for key, registers in delta['cells'].items():
+        cells[key] = hll_merge(cells[key], registers) if key in cells else registers
+    years = sketch['years'].union(delta['years']).sort_values(na_position='last')
+    return {'years': years, 'cells': cells, 'now': sketch['now']}
+
+
+@timed
+def count_sketch_accounts_by_age(sketch, year_range=None):
+    # Estimated unique accounts per age bin for an inclusive affiliation-year range
+    counts = np.zeros(len(AGE_LABELS), dtype=np.int64)
+    for age in range(len(AGE_LABELS)):
+        cells = [registers for (cell_age, year), registers in sketch['cells'].items() if cell_age == age and (
+            not year_range or (year is not None and year_range[0] <= year <= year_range[1]))]
+        if cells:
+            counts[age] = hll_count(hll_merge(*cells))
+    return counts
+
+
+@timed
+def get_account_age_index(uploaded_file):
+    # Rebuilt once per dataset version and day so the age buckets stay correct;
+    # the previous day's index is dropped
+    now = pd.Timestamp.now()
+    if sqlBackend.use_sql(uploaded_file):
+        # Only the distinct account rows leave the database
+        return derived("account_age_index_sql", sqlBackend.database_fingerprint(uploaded_file),
+                       lambda: build_account_age_index(sqlBackend.account_age_source(uploaded_file), now), daily=True)
+    if is_streamed(uploaded_file):
+        # Uploads are folded into per-cell distinct-account sketches chunk by chunk
+        return fold_upload(uploaded_file, "account_age_sketch", ACCOUNT_AGE_COLUMNS,
+                           lambda chunk: build_account_age_sketch(chunk, now), merge_account_age_sketch, daily=True,
+                           optional=ACCOUNT_AGE_OPTIONAL_COLUMNS)
+    df, fingerprint = load_source(uploaded_file, columns=ACCOUNT_AGE_COLUMNS, optional=ACCOUNT_AGE_OPTIONAL_COLUMNS)
+    return derived("account_age_index", fingerprint, lambda: build_account_age_index(df, now), daily=True)
+
+
+@timed
+def get_affiliation_year_bounds(uploaded_file):
+    years = get_account_age_index(uploaded_file)['years'].dropna()
+    return int(years.min()), int(years.max())
+
+
+@timed
+def count_accounts_by_age(index, year_range=None):
+    # Unique accounts per age bin for an inclusive affiliation-year range
+    if 'cells' in index:
+        return count_sketch_accounts_by_age(index, year_range)
+    years, prefix = index['years'], index['prefix']
     if year_range:
-        df = df[(df['afiliacion_year'] >= year_range[0]) & (df['afiliacion_year'] <= year_range[1])]
-    
-    # Create a new column for account age in years
-    if 'account_age_years' not in df.columns:
-        if 'fecha_afiliacion' in df.columns:
-            df['fecha_afiliacion'] = pd.to_datetime(df['fecha_afiliacion'], errors='coerce')
-            df['account_age_years'] = (pd.Timestamp.now() - df['fecha_afiliacion']).dt.days / 365.25
-        else:
-            raise ValueError("Column 'account_age_years' or 'fecha_afiliacion' not found in data.")
-
-    # Assume 'account_age_years' column exists
-    if 'account_age_years' not in df.columns:
-        raise ValueError("Column 'account_age_years' not found in data.")
-
-    # Bin account ages
-    bins = [0, 1, 3, np.inf]
-    labels = ['< 1 year', '1-3 years', '> 3 years']
-    df['age_group'] = pd.cut(df['account_age_years'], bins=bins, labels=labels, right=False)
+        valid_years = years.dropna().to_numpy()
+        start = int(np.searchsorted(valid_years, year_range[0], side='left'))
+        end = int(np.searchsorted(valid_years, year_range[1], side='right')) - 1
+    else:
+        start, end = 0, len(years) - 1
+    if start > end:
+        return np.zeros(len(AGE_LABELS), dtype=np.int64)
+    return prefix[:, end + 1, start + 1] - prefix[:, start, start + 1]
+
+
+@timed
+def get_account_age_plotly_figure_by_affiliation(uploaded_file, year_range=None, height=400, width=600):
+    # Accept a file path, an uploaded file-like object or an already-loaded frame
+    index = get_account_age_index(uploaded_file)
 
     # Count unique accounts per group
-    grouped = df.groupby('age_group', observed=False)['external_account_id'].nunique().reset_index()
-    grouped = grouped.rename(columns={'external_account_id': 'account_count'})
+    grouped = pd.DataFrame({
+        'age_group': AGE_LABELS,
+        'account_count': count_accounts_by_age(index, year_range),
+    })
 
     fig = go.Figure()
     fig.add_trace(go.Bar(
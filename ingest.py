@@ -0,0 +1,61 @@
+import sys
+
+import pandas as pd
+
+from dataStore import DEFAULT_CSV_PATH, load_dataset, dataset_fingerprint, derived, register_merge
+
+# Appending rows to the csv is enough for a running dashboard: load_dataset
+# notices that the file only grew, parses just the new bytes and folds them
+# into every cached rollup with a registered merge (KPIs, importe rollup, risk
+# counts, account-age index and the loan_request_id watermark below).
+
+
+def _max_request_id(values):
+    return pd.Series(values, dtype=float).max()
+
+
+register_merge(
+    "loan_request_watermark",
+    lambda watermark, delta_df: _max_request_id([watermark, _max_request_id(delta_df['loan_request_id'])]),
+)
+
+
+def get_watermark(path=DEFAULT_CSV_PATH):
+    # Highest loan_request_id already in the dataset, NaN when it is empty
+    frame = load_dataset(path, columns=['loan_request_id'])
+    return derived("loan_request_watermark", dataset_fingerprint(frame), lambda: _max_request_id(frame['loan_request_id']))
+
+
+def append_rows(new_rows, path=DEFAULT_CSV_PATH):
+    # Append the rows above the loan_request_id watermark to the csv and fold
+    # them into this process' caches. Returns the number of rows appended.
+    watermark = get_watermark(path)
+    if not pd.isna(watermark):
+        new_rows = new_rows[new_rows['loan_request_id'] > watermark]
+    if new_rows.empty:
+        return 0
+
+    columns = pd.read_csv(path, nrows=0).columns
+    missing = [c for c in columns if c not in new_rows.columns]
+    if missing:
+        raise ValueError(f"Columns {missing} not found in new rows.")
+
+    with open(path, "rb") as f:
+        size = f.seek(0, 2)
+        if size:
+            f.seek(-1, 2)
+        needs_newline = size > 0 and f.read(1) != b"\n"
+    with open(path, "a", newline="") as f:
+        if needs_newline:
+            f.write("\n")
+        new_rows[list(columns)].to_csv(f, header=False, index=False)
+
+    load_dataset(path)
+    return len(new_rows)
+
+
+if __name__ == "__main__":
+    # python ingest.py new_rows.csv [target.csv]
+    batch = pd.read_csv(sys.argv[1])
+    target = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_CSV_PATH
+    print(f"Appended {append_rows(batch, target)} rows to {target}")
@@ -0,0 +1,179 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from dataStore import IMPORTE_SCALE, MissingColumnsError, atomic_write, load_source, derived, register_merge, is_stored_upload
+from perfSpans import timed
+from uploadStream import is_streamed, fold_upload
+
+KPI_JSON_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "kpis.json")
+
+KPI_COLUMNS = ['year', 'quarter', 'approved', 'ever_delinquent', 'medio_pago', 'total_importe']
+
+# KPI definitions
+#   Loan Approval Rate: share of loan requests with approved == 1
+#   Delinquency Rate: share of loan requests with ever_delinquent == 1
+#   Loan Requests per Quarter: loan requests per "<year>Q<quarter>"
+#   Loan Repayment Rate per Quarter: share of the quarter's requests that were
+#       approved and never went delinquent
+#   Average Purchase Value by Payment Type: mean total_importe per medio_pago
+
+
+@timed
+def build_kpi_stats(df):
+    # Sufficient statistics for every KPI, computed in one vectorized pass.
+    # The quarter key is factorized once and shared by both per-quarter KPIs.
+    # Everything is a count or an integer sum (total_importe in cents), so
+    # stats from separate batches add up exactly (see merge_kpi_stats).
+    approved = df['approved'].to_numpy(dtype=float) == 1
+    delinquent = df['ever_delinquent'].to_numpy(dtype=float) == 1
+    repaid = approved & ~delinquent
+
+    year = df['year'].to_numpy(dtype=float)
+    quarter = df['quarter'].to_numpy(dtype=float)
+    has_quarter = ~(np.isnan(year) | np.isnan(quarter))
+    quarter_key = np.where(has_quarter, year * 10 + quarter, 0).astype(np.int64)
+    quarter_values, quarter_codes = np.unique(quarter_key[has_quarter], return_inverse=True)
+
+    medio_codes, medio_values = pd.factorize(df['medio_pago'], sort=True)
+    importe = (df['total_importe'].to_numpy(dtype=float) * IMPORTE_SCALE).round()
+    has_medio = (medio_codes >= 0) & ~np.isnan(importe)
+
+    return {
+        'rows': len(df),
+        'approved': int(approved.sum()),
+        'delinquent': int(delinquent.sum()),
+        'quarter_keys': [f"{key // 10}Q{key % 10}" for key in quarter_values],
+        'quarter_requests': np.bincount(quarter_codes, minlength=len(quarter_values)),
+        'quarter_repaid': np.bincount(quarter_codes, weights=repaid[has_quarter], minlength=len(quarter_values)),
+        'medio_pago': [str(value) for value in medio_values],
+        'importe_cents': np.bincount(medio_codes[has_medio], weights=importe[has_medio], minlength=len(medio_values)),
+        'importe_count': np.bincount(medio_codes[has_medio], minlength=len(medio_values)),
+    }
+
+
+def _merge_keyed(keys_a, keys_b, columns_a, columns_b):
+    keys = sorted(set(keys_a) | set(keys_b))
+    merged = []
+    for column_a, column_b in zip(columns_a, columns_b):
+        total = pd.Series(column_a, index=keys_a, dtype=float).add(
+            pd.Series(column_b, index=keys_b, dtype=float), fill_value=0)
+        merged.append(total.reindex(keys).to_numpy())
+    return keys, merged
+
+
+@timed
+def merge_kpi_stats(stats, delta):
+    # Add the stats of a new batch of rows to existing stats
+    quarter_keys, (quarter_requests, quarter_repaid) = _merge_keyed(
+        stats['quarter_keys'], delta['quarter_keys'],
+        (stats['quarter_requests'], stats['quarter_repaid']),
+        (delta['quarter_requests'], delta['quarter_repaid']))
+    medio_pago, (importe_cents, importe_count) = _merge_keyed(
+        stats['medio_pago'], delta['medio_pago'],
+        (stats['importe_cents'], stats['importe_count']),
+        (delta['importe_cents'], delta['importe_count']))
+    return {
+        'rows': stats['rows'] + delta['rows'],
+        'approved': stats['approved'] + delta['approved'],
+        'delinquent': stats['delinquent'] + delta['delinquent'],
+        'quarter_keys': quarter_keys,
+        'quarter_requests': quarter_requests.astype(np.int64),
+        'quarter_repaid': quarter_repaid,
+        'medio_pago': medio_pago,
+        'importe_cents': importe_cents,
+        'importe_count': importe_count.astype(np.int64),
+    }
+
+
+register_merge("kpi_stats", lambda stats, delta_df: merge_kpi_stats(stats, build_kpi_stats(delta_df)))
+
+
+def kpis_from_stats(stats):
+    # Same shape as kpis.json
+    rows = stats['rows']
+    return {
+        "Loan Approval Rate": stats['approved'] / rows if rows else 0.0,
+        "Delinquency Rate": stats['delinquent'] / rows if rows else 0.0,
+        "Loan Requests per Quarter": {
+            key: int(count) for key, count in zip(stats['quarter_keys'], stats['quarter_requests'])
+        },
+        "Loan Repayment Rate per Quarter": {
+            key: float(repaid / count)
+            for key, repaid, count in zip(stats['quarter_keys'], stats['quarter_repaid'], stats['quarter_requests'])
+        },
+        "Average Purchase Value by Payment Type": {
+            key: float(cents / IMPORTE_SCALE / count)
+            for key, cents, count in zip(stats['medio_pago'], stats['importe_cents'], stats['importe_count'])
+            if count
+        },
+    }
+
+
+@timed
+def get_kpi_stats(uploaded_file):
+    # KPI stats built once per dataset version
+    if is_streamed(uploaded_file):
+        # Uploads are folded into the stats chunk by chunk; never written back
+        stats = fold_upload(uploaded_file, "kpi_stats_stream", KPI_COLUMNS, build_kpi_stats,
+                            lambda stats, chunk: merge_kpi_stats(stats, build_kpi_stats(chunk)))
+        return stats, None
+    df, fingerprint = load_source(uploaded_file, columns=KPI_COLUMNS)
+    return derived("kpi_stats", fingerprint, lambda: build_kpi_stats(df)), fingerprint
+
+
+def read_kpis(path=KPI_JSON_PATH):
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def write_kpis(kpis, path=KPI_JSON_PATH):
+    with atomic_write(path) as tmp_path:
+        with open(tmp_path, "w") as f:
+            json.dump(kpis, f, indent=2)
+
+
+def _sync_kpis_json(kpis, path):
+    try:
+        stored = read_kpis(path)
+    except (OSError, ValueError):
+        stored = None
+    if stored != kpis:
+        try:
+            write_kpis(kpis, path)
+        except OSError:
+            return False  # read-only checkout, the computed values are still shown
+    return True
+
+
+@timed
+def get_kpis(uploaded_file, path=KPI_JSON_PATH):
+    # Compute the KPIs from the dataset and write them back to kpis.json once
+    # per dataset version. Uploads are never written back. Falls back to the
+    # stored json when the dataset lacks the KPI columns.
+    try:
+        stats, fingerprint = get_kpi_stats(uploaded_file)
+    except MissingColumnsError:
+        return read_kpis(path)
+    kpis = kpis_from_stats(stats)
+    if fingerprint is not None and not hasattr(uploaded_file, "read") and not is_stored_upload(uploaded_file):
+        # Each replica writes its own kpis.json, so this one is never shared
+        derived("kpis_json_synced", fingerprint, lambda: _sync_kpis_json(kpis, path), persist=False)
+    return kpis
+
+
+def kpi_table_frames(kpis):
+    # The three KPI tables of the Dashboard tab, formatted for display
+    return {
+        "requests": pd.DataFrame(list(kpis["Loan Requests per Quarter"].items()), columns=["Quarter", "Requests"]),
+        "repayment": pd.DataFrame(
+            [(k, f"{v:.2%}") for k, v in kpis["Loan Repayment Rate per Quarter"].items()],
+            columns=["Quarter", "Repayment Rate"]
+        ),
+        "avg_purchase": pd.DataFrame(
+            [(k, f"${v:,.2f}") for k, v in kpis["Average Purchase Value by Payment Type"].items()],
+            columns=["Payment Type", "Average Value"]
+        ),
+    }
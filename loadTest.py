@@ -0,0 +1,298 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+import numpy as np
+import pandas as pd
+from tornado.websocket import websocket_connect
+
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+from dataStore import DATA_DIR
+
+# Concurrent-session load test. Starts dashboard.py on a local headless
+# Streamlit server (or targets --url) and drives N simulated analysts over the
+# same websocket protocol as the browser: each one switches between the
+# Dashboard and Risk Management tabs, changes the year selectboxes and toggles
+# the Risk page filters. Every rerun is timed from the request to the server's
+# script_finished message. Reports latency percentiles, throughput and the
+# server's peak RSS per concurrency level and writes them as json.
+# Run with: python loadTest.py --sessions 1,2,4,8 --actions 20
+LOADTEST_DIR = os.path.join(DATA_DIR, "loadtests")
+DEFAULT_SESSIONS = "1,2,4,8"
+APP_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dashboard.py")
+# Seconds a single rerun may take before the session counts it as failed
+RERUN_TIMEOUT = 300
+RSS_SAMPLE_SECONDS = 0.05
+
+DASHBOARD_TAB = "Dashboard"
+RISK_TAB = "Risk Management"
+IMPORTE_YEAR_LABEL = "Select Year for Importe"
+RISK_YEAR_LABEL = "Select Year for Risk"
+RISK_FILTER_LABELS = ("Risk Level", "Most Purchased Category")
+
+
+class Session:
+    # One simulated browser tab: its websocket plus the widgets the server
+    # last rendered and the widget values this session has set
+
+    def __init__(self, url, rng):
+        self.url = url
+        self.rng = rng
+        self.ws = None
+        self.tab = DASHBOARD_TAB
+        self.widgets = {}  # label -> (widget id, options, fragment id)
+        self.states = {}  # widget id -> WidgetState
+        self.errors = 0
+
+    async def connect(self):
+        self.ws = await websocket_connect(self.url, subprotocols=["streamlit"])
+
+    def close(self):
+        if self.ws is not None:
+            self.ws.close()
+
+    def _set(self, widget_id, field, value):
+        state = WidgetState(id=widget_id)
+        if field == "string_array_value":
+            state.string_array_value.data.extend(value)
+        else:
+            setattr(state, field, value)
+        self.states[widget_id] = state
+
+    def _remember(self, delta):
+        element = delta.delta.new_element
+        kind = element.WhichOneof("type")
+        if kind in ("selectbox", "multiselect"):
+            widget = getattr(element, kind)
+            self.widgets[widget.label] = (widget.id, list(widget.options), delta.delta.fragment_id)
+        elif kind == "component_instance" and element.component_instance.component_name.endswith("option_menu"):
+            self.widgets["option_menu"] = (element.component_instance.id, None, "")
+        elif kind == "exception":
+            self.errors += 1
+
+    async def rerun(self, fragment_id=""):
+        # Request a rerun with every widget value set so far and wait until it
+        # finishes; returns the elapsed seconds
+        message = BackMsg()
+        message.rerun_script.query_string = ""
+        message.rerun_script.page_script_hash = ""
+        message.rerun_script.fragment_id = fragment_id
+        message.rerun_script.widget_states.widgets.extend(self.states.values())
+        start = time.perf_counter()
+        await self.ws.write_message(message.SerializeToString(), binary=True)
+        while True:
+            raw = await asyncio.wait_for(self.ws.read_message(), RERUN_TIMEOUT)
+            if raw is None:
+                raise ConnectionError("websocket closed by the server")
+            forward = ForwardMsg()
+            forward.ParseFromString(raw)
+            kind = forward.WhichOneof("type")
+            if kind == "delta":
+                self._remember(forward)
+            elif kind == "script_finished":
+                if forward.script_finished == ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    continue
+                if forward.script_finished == ForwardMsg.FINISHED_WITH_COMPILE_ERROR:
+                    self.errors += 1
+                return time.perf_counter() - start
+
+    def actions(self):
+        # (action name, coroutine factory) pairs possible on the current tab
+        possible = [("switch_tab", self.switch_tab)]
+        if self.tab == DASHBOARD_TAB:
+            possible += [(f"year:{label}", lambda label=label: self.change_year(label))
+                         for label in (IMPORTE_YEAR_LABEL, RISK_YEAR_LABEL) if label in self.widgets]
+        else:
+            possible += [(f"filter:{label}", lambda label=label: self.toggle_filter(label))
+                         for label in RISK_FILTER_LABELS if label in self.widgets]
+        return possible
+
+    async def switch_tab(self):
+        self.tab = RISK_TAB if self.tab == DASHBOARD_TAB else DASHBOARD_TAB
+        self._set(self.widgets["option_menu"][0], "json_value", json.dumps(self.tab))
+        return await self.rerun()
+
+    async def change_year(self, label):
+        # Year selectboxes live in fragments, so only their block reruns
+        widget_id, options, fragment_id = self.widgets[label]
+        self._set(widget_id, "string_value", self.rng.choice(options))
+        return await self.rerun(fragment_id)
+
+    async def toggle_filter(self, label):
+        # A random non-empty selection of the multiselect's options
+        widget_id, options, _ = self.widgets[label]
+        selection = [option for option in options if self.rng.random() < 0.7] or [self.rng.choice(options)]
+        self._set(widget_id, "string_array_value", selection)
+        return await self.rerun()
+
+
+async def _run_session(url, actions, seed, think_seconds, timings):
+    session = Session(url, random.Random(seed))
+    try:
+        await session.connect()
+        timings.append(("initial", await session.rerun()))
+        for _ in range(actions):
+            name, action = session.rng.choice(session.actions())
+            timings.append((name.split(":")[0], await action()))
+            if think_seconds:
+                await asyncio.sleep(session.rng.uniform(0, 2 * think_seconds))
+    finally:
+        session.close()
+    return session.errors
+
+
+def _rss_bytes(pid):
+    # Resident set size of a process, None where /proc is not available
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+async def _sample_rss(pid, peak, stop):
+    while not stop.is_set():
+        rss = _rss_bytes(pid)
+        if rss is not None:
+            peak[0] = max(peak[0] or 0, rss)
+        try:
+            await asyncio.wait_for(stop.wait(), RSS_SAMPLE_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+
+def _percentiles(seconds):
+    if not seconds:
+        return {"p50": None, "p95": None, "p99": None}
+    p50, p95, p99 = np.percentile(seconds, [50, 95, 99])
+    return {"p50": round(float(p50), 4), "p95": round(float(p95), 4), "p99": round(float(p99), 4)}
+
+
+async def run_level(url, sessions, actions, seed, think_seconds, server_pid=None):
+    # Run `sessions` concurrent sessions of `actions` interactions each
+    timings, peak, stop = [], [None], asyncio.Event()
+    sampler = asyncio.ensure_future(_sample_rss(server_pid, peak, stop)) if server_pid else None
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *(_run_session(url, actions, seed * 1000 + index, think_seconds, timings) for index in range(sessions)),
+        return_exceptions=True)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    if sampler is not None:
+        await sampler
+
+    failures = [result for result in results if isinstance(result, BaseException)]
+    by_action = {}
+    for name, seconds in timings:
+        by_action.setdefault(name, []).append(seconds)
+    return {
+        "sessions": sessions,
+        "reruns": len(timings),
+        "seconds": round(elapsed, 3),
+        "throughput": round(len(timings) / elapsed, 3) if elapsed else None,
+        "latency": _percentiles([seconds for _, seconds in timings]),
+        "latency_by_action": {name: {"count": len(values), **_percentiles(values)} for name, values in sorted(by_action.items())},
+        "app_errors": sum(result for result in results if not isinstance(result, BaseException)),
+        "failed_sessions": [repr(failure) for failure in failures],
+        "peak_rss_mb": round(peak[0] / 2 ** 20, 1) if peak[0] else None,
+    }
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port, log_path=os.devnull):
+    # dashboard.py on a headless local server; returns the process once healthy
+    log = open(log_path, "ab")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", APP_SCRIPT, "--server.headless=true",
+         f"--server.port={port}", "--server.address=127.0.0.1", "--browser.gatherUsageStats=false"],
+        stdout=log, stderr=subprocess.STDOUT, cwd=os.path.dirname(APP_SCRIPT))
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"streamlit exited with code {process.returncode}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1) as response:
+                if response.status == 200:
+                    return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("streamlit did not become healthy within 60s")
+
+
+def _report(level):
+    latency = level["latency"]
+    print(f"[loadTest] {level['sessions']:>4} sessions  {level['reruns']:>5} reruns  "
+          f"{level['throughput']:>7.2f}/s  p50 {latency['p50']:.3f}s  p95 {latency['p95']:.3f}s  "
+          f"p99 {latency['p99']:.3f}s  peak RSS {level['peak_rss_mb'] or '-'} MB"
+          + (f"  {len(level['failed_sessions'])} failed sessions" if level["failed_sessions"] else "")
+          + (f"  {level['app_errors']} app errors" if level["app_errors"] else ""), flush=True)
+
+
+def write_results(levels, metadata, path=None):
+    if path is None:
+        os.makedirs(LOADTEST_DIR, exist_ok=True)
+        path = os.path.join(LOADTEST_DIR, f"loadtest-{pd.Timestamp.now():%Y%m%d-%H%M%S}.json")
+    with open(path, "w") as f:
+        json.dump({"metadata": metadata, "levels": levels}, f, indent=1)
+    return path
+
+
+def main(args):
+    process = None
+    url, pid = args.url, args.pid
+    if url is None:
+        port = _free_port()
+        process = start_server(port, args.server_log or os.devnull)
+        url, pid = f"ws://127.0.0.1:{port}/_stcore/stream", process.pid
+    try:
+        levels = []
+        for sessions in (int(count) for count in args.sessions.split(",")):
+            level = asyncio.run(run_level(url, sessions, args.actions, args.seed, args.think, pid))
+            _report(level)
+            levels.append(level)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(30)
+    metadata = {
+        "created": pd.Timestamp.now().isoformat(timespec="seconds"),
+        "url": url,
+        "actions_per_session": args.actions,
+        "think_seconds": args.think,
+        "seed": args.seed,
+        "cpus": os.cpu_count(),
+        "env": {key: value for key, value in os.environ.items() if key.startswith("NEXUS_")},
+    }
+    print(f"[loadTest] results: {write_results(levels, metadata, args.output)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent-session load test of dashboard.py")
+    parser.add_argument("--sessions", default=DEFAULT_SESSIONS, help=f"comma-separated concurrency levels (default {DEFAULT_SESSIONS})")
+    parser.add_argument("--actions", type=int, default=20, help="interactions per session after its first run")
+    parser.add_argument("--think", type=float, default=0.0, help="mean pause between interactions, in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--url", help="websocket of a running server, e.g. ws://localhost:8501/_stcore/stream")
+    parser.add_argument("--pid", type=int, help="pid of that server, for peak RSS")
+    parser.add_argument("--server-log", help="file for the output of the started server")
+    parser.add_argument("--output", help=f"results json (default: {LOADTEST_DIR}/loadtest-<time>.json)")
+    main(parser.parse_args())
@@ -0,0 +1,166 @@
+import atexit
+import os
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+# NEXUS_MEMORY_PROFILE=1 traces Python allocations with tracemalloc and
+# attributes them to the components perfSpans already wraps: each page's
+# main(), the chart builders, the Risk page aggregations and the dataset
+# loader. Per component it keeps the peak traced bytes above the level at
+# entry, the bytes still allocated at exit (retained), the RSS delta and the
+# change in Arrow-allocated bytes (the sidecar's buffers are not traced).
+# Outermost components also record which source lines their retained bytes
+# come from. The report is shown in the admin panel (?admin=1) and printed
+# to the server log at exit. Tracing slows the app down and nested or
+# concurrent components share the process-wide counters, so numbers are
+# exact for a single session. NEXUS_MEMORY_PROFILE_FRAMES sets the traceback
+# depth kept per allocation (default 1, the allocating line).
+MEMORY_PROFILE = os.environ.get("NEXUS_MEMORY_PROFILE", "0") == "1"
+TRACE_FRAMES = int(os.environ.get("NEXUS_MEMORY_PROFILE_FRAMES", "1"))
+TOP_SITES = 10
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_lock = threading.Lock()
+_local = threading.local()
+_components = {}
+_SITE_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+
+def _rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _arrow_bytes():
+    return pa.total_allocated_bytes() if pa is not None else 0
+
+
+def _snapshot():
+    return tracemalloc.take_snapshot().filter_traces(_SITE_FILTERS)
+
+
+def _site(statistic):
+    # file:line, relative to the app or to site-packages
+    frame = statistic.traceback[0]
+    filename = frame.filename
+    if filename.startswith(APP_DIR + os.sep):
+        filename = os.path.relpath(filename, APP_DIR)
+    elif "site-packages" + os.sep in filename:
+        filename = filename.split("site-packages" + os.sep, 1)[1]
+    return f"{filename}:{frame.lineno}"
+
+
+def _remember(name, peak, retained, rss_delta, arrow_delta, sites):
+    with _lock:
+        stats = _components.setdefault(name, {
+            "calls": 0, "peak_max": 0, "retained_total": 0, "rss_delta_total": 0, "arrow_delta_total": 0, "sites": [],
+        })
+        stats["calls"] += 1
+        stats["peak_last"] = peak
+        stats["peak_max"] = max(stats["peak_max"], peak)
+        stats["retained_last"] = retained
+        stats["retained_total"] += retained
+        stats["rss_delta_last"] = rss_delta
+        stats["rss_delta_total"] += rss_delta or 0
+        stats["arrow_delta_total"] += arrow_delta
+        if sites:
+            stats["sites"] = sites
+
+
+@contextmanager
+def track(name):
+    # Attribute the allocations made inside the block to `name`
+    if not MEMORY_PROFILE or not tracemalloc.is_tracing():
+        yield
+        return
+    stack = _local.__dict__.setdefault("stack", [])
+    before = _snapshot() if not stack else None
+    current, peak = tracemalloc.get_traced_memory()
+    if stack:
+        # The enclosing component keeps the peak reached so far
+        stack[-1]["peak"] = max(stack[-1]["peak"], peak)
+    tracemalloc.reset_peak()
+    frame = {"start": current, "peak": current, "rss": _rss_bytes(), "arrow": _arrow_bytes()}
+    stack.append(frame)
+    try:
+        yield
+    finally:
+        current, peak = tracemalloc.get_traced_memory()
+        peak = max(frame["peak"], peak)
+        stack.pop()
+        if stack:
+            stack[-1]["peak"] = max(stack[-1]["peak"], peak)
+        rss = _rss_bytes()
+        sites = []
+        if before is not None:
+            for statistic in _snapshot().compare_to(before, "lineno")[:TOP_SITES]:
+                if statistic.size_diff > 0:
+                    sites.append((_site(statistic), statistic.size_diff, statistic.count_diff))
+            before = None
+        _remember(name, peak - frame["start"], current - frame["start"],
+                  rss - frame["rss"] if rss is not None and frame["rss"] is not None else None,
+                  _arrow_bytes() - frame["arrow"], sites)
+
+
+def component_summary():
+    # Per component, largest peak first
+    with _lock:
+        return sorted(
+            ({"component": name, **{key: value for key, value in stats.items() if key != "sites"}}
+             for name, stats in _components.items()),
+            key=lambda row: row["peak_max"], reverse=True)
+
+
+def component_sites():
+    # Source lines behind the retained bytes of the last outermost call
+    with _lock:
+        return {name: list(stats["sites"]) for name, stats in _components.items() if stats["sites"]}
+
+
+def allocation_sites(limit=TOP_SITES):
+    # Source lines holding the most traced memory right now
+    if not tracemalloc.is_tracing():
+        return []
+    return [(_site(statistic), statistic.size, statistic.count)
+            for statistic in _snapshot().statistics("lineno")[:limit]]
+
+
+def _mb(value):
+    return "-" if value is None else f"{value / 2 ** 20:9.2f}"
+
+
+def format_report():
+    lines = [f"[memoryProfile] {'component':<56} {'calls':>6} {'peak MB':>9} {'retained MB':>12} "
+             f"{'arrow MB':>9} {'RSS delta MB':>13}"]
+    for row in component_summary():
+        lines.append(f"[memoryProfile] {row['component']:<56} {row['calls']:>6} {_mb(row['peak_max'])} "
+                     f"{_mb(row['retained_total']):>12} {_mb(row['arrow_delta_total'])} {_mb(row['rss_delta_total']):>13}")
+    lines.append("[memoryProfile] largest live allocation sites")
+    for site, size, count in allocation_sites():
+        lines.append(f"[memoryProfile]   {_mb(size)} MB in {count:>9,} blocks  {site}")
+    return "\n".join(lines)
+
+
+def _report_at_exit():
+    if _components:
+        print(format_report(), flush=True)
+
+
+if MEMORY_PROFILE:
+    tracemalloc.start(TRACE_FRAMES)
+    atexit.register(_report_at_exit)
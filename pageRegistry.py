@@ -0,0 +1,55 @@
+import importlib
+import sys
+import threading
+import time
+
+# option_menu label -> module behind it. "Dashboard" is the chart stack
+# (graph modules, plotly, KPI engine) reached through warmup.
+PAGES = {
+    "Dashboard": "warmup",
+    "About Ximple": "pages.Acerca_de",
+    "Machine Learning": "pages.ML_Models",
+    "Risk Management": "pages.User_Persona_Dashboard",
+    "Main Takeaway": "pages.Key_Findings",
+    "Meet Nexus": "pages.Meet_Nexus",
+}
+
+_lock = threading.Lock()
+_modules = {}
+_import_report = {}
+
+
+def load_page(label):
+    # Import a page module on first selection and reuse it afterwards
+    with _lock:
+        module = _modules.get(label)
+        if module is None:
+            modules_before = len(sys.modules)
+            start = time.perf_counter()
+            module = importlib.import_module(PAGES[label])
+            seconds = time.perf_counter() - start
+            _modules[label] = module
+            _import_report[label] = {
+                "page": label,
+                "module": PAGES[label],
+                "import_seconds": seconds,
+                "modules_loaded": len(sys.modules) - modules_before,
+            }
+            print(f"[pageRegistry] {label} ({PAGES[label]}) imported in {seconds:.3f}s, "
+                  f"{len(sys.modules) - modules_before} new modules", flush=True)
+        return module
+
+
+def import_report():
+    # Import cost of every page loaded so far in this process, in load order.
+    # Modules shared with an earlier page are only counted for the first one.
+    with _lock:
+        return list(_import_report.values())
+
+
+if __name__ == "__main__":
+    # python pageRegistry.py: cold-start import cost of every page
+    for label in PAGES:
+        load_page(label)
+    total = sum(row["import_seconds"] for row in import_report())
+    print(f"[pageRegistry] total {total:.3f}s")
@@ -2,9 +2,199 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import plotly.graph_objects as go
-import os
+import plotly.io as pio
+from dataStore import DEFAULT_CSV_PATH, load_dataset, dataset_fingerprint, derived, with_columns
+from riskAnalytics import (
+    RISK_PAGE_COLUMNS,
+    get_filter_index,
+    get_sql_filter_options,
+    filter_mask,
+    canonical_filter,
+    build_risk_page_summaries,
+    build_sql_risk_page_summaries,
+)
+import sqlBackend
+from resultCache import risk_page_cache
+from tableViewer import PAGE_SIZES, sorted_positions, page_count, page_of_rows
+from perfSpans import span, timed
+from perfPanel import plotly_chart
 
-def main():
+# Columns of the csv this page reads (see dashboard.py)
+REQUIRED_COLUMNS = RISK_PAGE_COLUMNS
+
+# Update the labels for the graphs to display "No Risk" and "Risk"
+riskclient_map = {0: "No Risk", 1: "Risk"}
+colors = ["#824d74", "#be7b72"]
+
+
+@timed
+def build_figures(summaries, risk_levels):
+    risk_summary = summaries['risk_summary']
+    figures = {}
+
+    fig = go.Figure(go.Pie(
+        labels=risk_summary['riskclient'].map(riskclient_map),  # Map 0/1 to "No Risk"/"Risk"
+        values=risk_summary['num_loans'],
+        marker=dict(colors=colors),
+        textinfo='label+percent',
+        textfont=dict(color='white', size=22),
+        insidetextfont=dict(color='white', size=22),
+        hole=0,
+    ))
+    fig.update_layout(
+        height=400,
+        width=400,
+        margin=dict(l=0, r=0, t=40, b=0),
+        showlegend=True,
+        legend=dict(font=dict(size=16), orientation="h", y=-0.1, x=0.5, xanchor="center"),
+    )
+    figures['loans_by_risk'] = fig
+
+    figures['ever_delinquent'] = None
+    risk1_df = risk_summary[risk_summary['riskclient'] == 1]
+    if not risk1_df.empty:
+        risk1_rate = risk1_df['ever_delinquent_rate'].iloc[0] * 100  # as percentage
+        figures['ever_delinquent'] = go.Figure(go.Indicator(
+            mode="gauge+number",
+            value=risk1_rate,
+            number={'suffix': "%"},
+            gauge={
+                'axis': {'range': [0, 100]},
+                'bar': {'color': "#be7b72"},
+                'steps': [
+                    {'range': [0, 50], 'color': "#f0e6e6"},
+                    {'range': [50, 100], 'color': "#f5cccc"}
+                ],
+            },
+            title={'text': "Percentage of Payments not Paid"}
+        ))
+
+    # Category groups (first word without "item_"), small groups folded into "Otros"
+    category_by_risk_grouped = summaries['category_by_risk']
+    fig3 = go.Figure()
+    for i, risk in enumerate(risk_levels):
+        df_risk = category_by_risk_grouped[category_by_risk_grouped['riskclient'] == risk]
+        fig3.add_trace(go.Bar(
+            x=df_risk['category_group'],
+            y=df_risk['count'],
+            name=riskclient_map[risk],
+            marker_color=colors[i % len(colors)]
+        ))
+    fig3.update_layout(
+        title='Most Purchased Category by Risk Level',
+        xaxis_title='Category Group',
+        yaxis_title='Count',
+        barmode='stack'
+    )
+    figures['category'] = fig3
+
+    # Payment methods come capitalized
+    payment_method_by_risk = summaries['payment_method_by_risk']
+    fig4 = go.Figure()
+    for i, risk in enumerate(risk_levels):
+        df_risk = payment_method_by_risk[payment_method_by_risk['riskclient'] == risk]
+        fig4.add_trace(go.Bar(
+            x=df_risk['medio_pago'],
+            y=df_risk['count'],
+            name=riskclient_map[risk],  # Map 0/1 to "No Risk"/"Risk"
+            marker_color=colors[i % len(colors)]
+        ))
+    fig4.update_layout(
+        title='Payment Method by Risk Level',
+        xaxis_title='Payment Method',
+        yaxis_title='Count',
+        barmode='stack'
+    )
+    figures['payment_method'] = fig4
+
+    tenure_by_risk = summaries['tenure_by_risk']
+    fig5 = go.Figure()
+    for i, risk in enumerate(risk_levels):
+        df_risk = tenure_by_risk[tenure_by_risk['riskclient'] == risk]
+        fig5.add_trace(go.Bar(
+            x=[riskclient_map[risk]],  # Map 0/1 to "No Risk"/"Risk"
+            y=df_risk['days_since_affiliation'],
+            name=riskclient_map[risk],  # Map 0/1 to "No Risk"/"Risk"
+            marker_color=colors[i % len(colors)]
+        ))
+    fig5.update_layout(
+        title='Average Days Since Affiliation by Risk Level',
+        xaxis_title='Risk Level',
+        yaxis_title='Days Since Affiliation',
+        barmode='group'
+    )
+    figures['tenure'] = fig5
+
+    # Loans, average importe and delinquencies by risk level and season
+    seasonality = summaries['seasonality']
+    fig6 = go.Figure()
+    for i, season in enumerate(['High', 'Low']):
+        df_season = seasonality[seasonality['seasonality_label'] == season]
+        fig6.add_trace(go.Bar(
+            x=df_season['riskclient'].map(riskclient_map),
+            y=df_season['num_loans'],
+            name=season,
+            marker_color=colors[i % len(colors)],
+            customdata=df_season['seasonality_label'],
+            hovertemplate="<b>Risk Level:</b> %{x}<br><b>Seasonality:</b> %{customdata}<br><b>Number of Loans:</b> %{y}<extra></extra>"
+        ))
+    fig6.update_layout(
+        title='Loans by Risk Level and Seasonality',
+        xaxis_title='Risk Level',
+        yaxis_title='Number of Loans',
+        barmode='group',
+        legend_title_text='Seasonality'
+    )
+    figures['seasonality'] = fig6
+
+    return figures
+
+
+@timed
+def build_results(summaries, risk_levels):
+    # Figures are stored serialized so the cached entry is immutable and measurable
+    figures = build_figures(summaries, risk_levels)
+    return {
+        'summaries': summaries,
+        'figures': {name: fig.to_json() if fig is not None else None for name, fig in figures.items()},
+    }
+
+
+def show_raw_data(columns, total_rows, fetch_page):
+    # Server-side paginated viewer: nothing beyond the row count is computed
+    # until rows are requested, and only one projected page is sent.
+    # fetch_page(columns, sort_by, ascending, page, page_size) returns the rows.
+    st.caption(f"{total_rows:,} rows match the current filters")
+    load_rows = st.toggle("Show rows", value=False, key="raw_data_show")
+    if not load_rows:
+        return
+
+    col1, col2, col3 = st.columns([3, 2, 1])
+    with col1:
+        selected_columns = st.multiselect("Columns", columns, default=columns, key="raw_data_columns")
+    with col2:
+        sort_by = st.selectbox("Sort by", ["(none)"] + columns, key="raw_data_sort_by")
+        sort_by = None if sort_by == "(none)" else sort_by
+    with col3:
+        ascending = st.radio("Order", ["Asc", "Desc"], horizontal=True, key="raw_data_order") == "Asc"
+
+    if not selected_columns:
+        st.info("Select at least one column.")
+        return
+
+    col4, col5 = st.columns([1, 1])
+    with col4:
+        page_size = st.selectbox("Rows per page", PAGE_SIZES, index=1, key="raw_data_page_size")
+    pages = page_count(total_rows, page_size)
+    with col5:
+        page = st.number_input("Page", min_value=1, max_value=pages, value=1, step=1, key="raw_data_page")
+    page = min(page, pages)
+
+    st.dataframe(fetch_page(selected_columns, sort_by, ascending, page, page_size), use_container_width=True)
+    st.caption(f"Page {page} of {pages} · {total_rows:,} rows")
+
+
+def main(csv_path=DEFAULT_CSV_PATH):
     st.title("Risk Management Dashboard")
 
     # Custom CSS to set selected filter color to #be7b72
@@ -26,21 +216,41 @@ def main():
         unsafe_allow_html=True
     )
 
-    # Load data
-    DATA_PATH = os.path.join(os.path.dirname(__file__), '../Data/aggregated_df.csv')
-    df = pd.read_csv(DATA_PATH)
+    today = pd.Timestamp.today().date().isoformat()
+    use_sql = sqlBackend.use_sql(csv_path)
+
+    if use_sql:
+        # Filters, group-bys and raw data pages run in the SQL backend
+        fingerprint = sqlBackend.database_fingerprint(csv_path)
+        filter_index = get_sql_filter_options(csv_path)
+    else:
+        # Load data (parsed once per process, shared read-only across sessions)
+        base_df = load_dataset(csv_path)
+
+        # Preprocessing, built once per dataset version and day (the previous
+        # day's frame is dropped); the base columns are shared, not copied
+        @timed
+        def preprocess():
+            fecha_afiliacion = pd.to_datetime(base_df['fecha_afiliacion'])
+            return with_columns(
+                base_df,
+                fecha_afiliacion=fecha_afiliacion,
+                days_since_affiliation=(pd.Timestamp.today().normalize() - fecha_afiliacion).dt.days,
+            )
 
-    # Preprocessing
-    df['fecha_afiliacion'] = pd.to_datetime(df['fecha_afiliacion'])
-    df['days_since_affiliation'] = (pd.Timestamp.today() - df['fecha_afiliacion']).dt.days
+        fingerprint = dataset_fingerprint(base_df)
+        # A full copy of the dataset, cheaper to rebuild than to share on disk
+        df = derived("risk_page_frame", fingerprint, preprocess, persist=False, daily=True)
+
+        # Bitmaps per risk level and category, built once per dataset version
+        filter_index = get_filter_index(csv_path)
 
     # Top filters (not sidebar)
     with st.container():
         col1, col3 = st.columns([1, 2])  # Adjust column widths after removing col2
         with col1:
             # Map 0 and 1 to "No Risk" and "Risk" for display purposes
-            riskclient_map = {0: "No Risk", 1: "Risk"}
-            risk_levels = sorted(df['riskclient'].unique())  # Ensure risk_levels contains the original values (0 and 1)
+            risk_levels = filter_index['risk_values']  # Sorted original values (0 and 1)
             risk_levels_display = [riskclient_map[risk] for risk in risk_levels]
             selected_risk_display = st.multiselect("Risk Level", risk_levels_display, default=risk_levels_display)
 
@@ -48,9 +258,9 @@ def main():
             selected_risk = [key for key, value in riskclient_map.items() if value in selected_risk_display]
 
         with col3:
-            # Remove the "item_" prefix from the 'most_purchased_category' column for display purposes
-            category_display = df['most_purchased_category'].str.replace('item_', '', regex=False).unique()
-            category_mapping = dict(zip(category_display, df['most_purchased_category'].unique()))  # Map cleaned names back to original
+            # Category names without the "item_" prefix, mapped back to the original values
+            category_mapping = filter_index['category_display']
+            category_display = list(category_mapping)
 
             # Display the cleaned category names in the multiselect
             selected_category_display = st.multiselect(
@@ -60,69 +270,71 @@ def main():
             )
 
             # Reverse map the selected display values back to the original values for filtering
-            category_filter = [category_mapping[display] for display in selected_category_display]
+            category_filter = [value for display in selected_category_display for value in category_mapping[display]]
 
-    # Apply filters to the DataFrame
-    filtered_df = df[df['riskclient'].isin(selected_risk)]
-    if category_filter:
-        filtered_df = filtered_df[filtered_df['most_purchased_category'].isin(category_filter)]
+    # Summaries and figures are cached per dataset version and canonical
+    # filter selection, shared across sessions (see resultCache)
+    cache_key = (
+        fingerprint,
+        today,
+        canonical_filter(filter_index, selected_risk, category_filter),
+    )
 
-    st.markdown("### Risk Profile Overview")
-    risk_summary = filtered_df.groupby('riskclient').agg(
-        num_loans=('loan_request_id', 'count'),
-        approval_rate=('approved', 'mean'),
-        avg_importe=('total_importe', 'mean'),
-        avg_delinquencies=('num_delinquencies', 'mean'),
-        ever_delinquent_rate=('ever_delinquent', 'mean')
-    ).reset_index()
+    if use_sql:
+        def build_summaries():
+            return build_sql_risk_page_summaries(csv_path, selected_risk, category_filter, today)
+
+        total_rows = risk_page_cache.get_or_build(
+            (cache_key, "rows"), lambda: sqlBackend.count_rows(csv_path, selected_risk, category_filter))
+        columns = sqlBackend.columns(csv_path) + ['days_since_affiliation']
+
+        def fetch_page(selected_columns, sort_by, ascending, page, page_size):
+            rows = sqlBackend.page_rows(
+                csv_path, selected_columns, (page - 1) * page_size, page_size, today,
+                selected_risk, category_filter, sort_by, ascending)
+            if 'fecha_afiliacion' in rows.columns:
+                rows['fecha_afiliacion'] = pd.to_datetime(rows['fecha_afiliacion'])
+            return rows
+    else:
+        # Apply filters through the bitmap index; the filtered rows themselves
+        # are only materialized when the summaries are not cached yet
+        mask = filter_mask(filter_index, selected_risk, category_filter)
 
-    # Update the labels for the graphs to display "No Risk" and "Risk"
-    riskclient_map = {0: "No Risk", 1: "Risk"}
+        def build_summaries():
+            return build_risk_page_summaries(df[mask])
+
+        total_rows = int(np.count_nonzero(mask))
+        columns = list(df.columns)
+
+        def fetch_page(selected_columns, sort_by, ascending, page, page_size):
+            # Row positions are only built when a page is shown; sort orders
+            # are shared with the other cached results of the same filter
+            positions = np.flatnonzero(mask)
+            order = positions
+            if sort_by is not None:
+                order = risk_page_cache.get_or_build(
+                    (cache_key, "order", sort_by, ascending),
+                    lambda: sorted_positions(df, positions, sort_by, ascending),
+                )
+            return page_of_rows(df, order, page, page_size, selected_columns)
+
+    results = risk_page_cache.get_or_build(cache_key, lambda: build_results(build_summaries(), risk_levels))
+    with span("risk_page:figures_from_json"):
+        figures = {name: pio.from_json(figure) if figure is not None else None for name, figure in results['figures'].items()}
+
+    st.markdown("### Risk Profile Overview")
 
     # First row of charts
     with st.expander("Toggle", expanded=True):
         col1, col2 = st.columns([1, 1], gap="large")
         with col1:
-            colors = ["#824d74", "#be7b72"]
             st.markdown("<div style='text-align: center;'><b>Number of Loans by Risk Level</b></div>", unsafe_allow_html=True)
-            fig = go.Figure(go.Pie(
-                labels=risk_summary['riskclient'].map(riskclient_map),  # Map 0/1 to "No Risk"/"Risk"
-                values=risk_summary['num_loans'],
-                marker=dict(colors=colors),
-                textinfo='label+percent',
-                textfont=dict(color='white', size=22),
-                insidetextfont=dict(color='white', size=22),
-                hole=0,
-            ))
-            fig.update_layout(
-                height=400,
-                width=400,
-                margin=dict(l=0, r=0, t=40, b=0),
-                showlegend=True,
-                legend=dict(font=dict(size=16), orientation="h", y=-0.1, x=0.5, xanchor="center"),
-            )
-            st.plotly_chart(fig, use_container_width=True)
+            plotly_chart('risk_page:loans_by_risk', figures['loans_by_risk'], use_container_width=True)
 
         with col2:
-            risk1_df = risk_summary[risk_summary['riskclient'] == 1]
-            if not risk1_df.empty:
-                risk1_rate = risk1_df['ever_delinquent_rate'].iloc[0] * 100  # as percentage
+            if figures['ever_delinquent'] is not None:
                 st.markdown("#### Ever Delinquent Rate")
-                fig_gauge = go.Figure(go.Indicator(
-                    mode="gauge+number",
-                    value=risk1_rate,
-                    number={'suffix': "%"},
-                    gauge={
-                        'axis': {'range': [0, 100]},
-                        'bar': {'color': "#be7b72"},
-                        'steps': [
-                            {'range': [0, 50], 'color': "#f0e6e6"},
-                            {'range': [50, 100], 'color': "#f5cccc"}
-                        ],
-                    },
-                    title={'text': "Percentage of Payments not Paid"}
-                ))
-                st.plotly_chart(fig_gauge, use_container_width=True)
+                plotly_chart('risk_page:ever_delinquent', figures['ever_delinquent'], use_container_width=True)
             else:
                 st.info("No data for Risk Level 1 in current filter.")
 
@@ -132,72 +344,11 @@ def main():
         col3, col4 = st.columns(2)
         with col3:
             st.markdown("#### Most Purchased Category by Risk Level")
-            category_by_risk = filtered_df.groupby(['riskclient', 'most_purchased_category']).size().reset_index(name='count')
-
-            # Remove the "item_" prefix and group by the first word before underscore
-            category_by_risk['most_purchased_category_clean'] = category_by_risk['most_purchased_category'].str.replace('item_', '', regex=False)
-            category_by_risk['category_group'] = category_by_risk['most_purchased_category_clean'].str.split('_').str[0].str.capitalize()
-
-            # Group by riskclient and category_group, summing counts
-            grouped = category_by_risk.groupby(['riskclient', 'category_group'], as_index=False)['count'].sum()
-
-            # Group categories with counts < 10 for both "Risk" and "No Risk" into "Otros"
-            grouped_data = []
-            for group in grouped['category_group'].unique():
-                group_data = grouped[grouped['category_group'] == group]
-                risk_counts = group_data.groupby('riskclient')['count'].sum()
-                if all(risk_counts < 10):
-                    for risk in risk_counts.index:
-                        grouped_data.append({'riskclient': risk, 'category_group': 'Otros', 'count': risk_counts[risk]})
-                else:
-                    grouped_data.extend(group_data.to_dict('records'))
-
-            # Convert grouped data back to a DataFrame
-            category_by_risk_grouped = pd.DataFrame(grouped_data)
-            # Aggregate counts for "Otros" to ensure it is summed up properly
-            category_by_risk_grouped = category_by_risk_grouped.groupby(['riskclient', 'category_group'], as_index=False).agg({'count': 'sum'})
-
-            fig3 = go.Figure()
-            for i, risk in enumerate(risk_levels):
-                df_risk = category_by_risk_grouped[category_by_risk_grouped['riskclient'] == risk]
-                fig3.add_trace(go.Bar(
-                    x=df_risk['category_group'],
-                    y=df_risk['count'],
-                    name=riskclient_map[risk],
-                    marker_color=colors[i % len(colors)]
-                ))
-
-            fig3.update_layout(
-                title='Most Purchased Category by Risk Level',
-                xaxis_title='Category Group',
-                yaxis_title='Count',
-                barmode='stack'
-            )
-            st.plotly_chart(fig3, use_container_width=True)
+            plotly_chart('risk_page:category', figures['category'], use_container_width=True)
 
         with col4:
             st.markdown("#### Payment Method by Risk Level")
-            payment_method_by_risk = filtered_df.groupby(['riskclient', 'medio_pago']).size().reset_index(name='count')
-            # Capitalize the first letter of each payment method
-            payment_method_by_risk['medio_pago'] = payment_method_by_risk['medio_pago'].astype(str).str.capitalize()
-            
-            fig4 = go.Figure()
-            for i, risk in enumerate(risk_levels):
-                df_risk = payment_method_by_risk[payment_method_by_risk['riskclient'] == risk]
-                fig4.add_trace(go.Bar(
-                    x=df_risk['medio_pago'],
-                    y=df_risk['count'],
-                    name=riskclient_map[risk],  # Map 0/1 to "No Risk"/"Risk"
-                    marker_color=colors[i % len(colors)]
-                ))
-            
-            fig4.update_layout(
-                title='Payment Method by Risk Level',
-                xaxis_title='Payment Method',
-                yaxis_title='Count',
-                barmode='stack'
-            )
-            st.plotly_chart(fig4, use_container_width=True)
+            plotly_chart('risk_page:payment_method', figures['payment_method'], use_container_width=True)
 
     # Third row of charts
     st.markdown("### Tenure and Seasonality Analysis")
@@ -205,61 +356,16 @@ def main():
         col5, col6 = st.columns(2)
         with col5:
             st.markdown("#### Client Tenure vs. Risk")
-            tenure_by_risk = filtered_df.groupby('riskclient')['days_since_affiliation'].mean().reset_index()
-            
-            fig5 = go.Figure()
-            for i, risk in enumerate(risk_levels):
-                df_risk = tenure_by_risk[tenure_by_risk['riskclient'] == risk]
-                fig5.add_trace(go.Bar(
-                    x=[riskclient_map[risk]],  # Map 0/1 to "No Risk"/"Risk"
-                    y=df_risk['days_since_affiliation'],
-                    name=riskclient_map[risk],  # Map 0/1 to "No Risk"/"Risk"
-                    marker_color=colors[i % len(colors)]
-                ))
-            
-            fig5.update_layout(
-                title='Average Days Since Affiliation by Risk Level',
-                xaxis_title='Risk Level',
-                yaxis_title='Days Since Affiliation',
-                barmode='group'
-            )
-            st.plotly_chart(fig5, use_container_width=True)
+            plotly_chart('risk_page:tenure', figures['tenure'], use_container_width=True)
 
         with col6:
             st.markdown("#### Seasonality Analysis")
-            # Group by 'riskclient' and 'es_temporada_alta_real' to calculate the required metrics
-            seasonality = filtered_df.groupby(['riskclient', 'es_temporada_alta_real']).agg(
-                num_loans=('loan_request_id', 'count'),
-                avg_importe=('total_importe', 'mean'),
-                avg_delinquencies=('num_delinquencies', 'mean')
-            ).reset_index()
-            seasonality['seasonality_label'] = seasonality['es_temporada_alta_real'].map({1: 'High', 0: 'Low'})
-            
-            fig6 = go.Figure()
-            for i, season in enumerate(['High', 'Low']):
-                df_season = seasonality[seasonality['seasonality_label'] == season]
-                fig6.add_trace(go.Bar(
-                    x=df_season['riskclient'].map(riskclient_map),
-                    y=df_season['num_loans'],
-                    name=season,
-                    marker_color=colors[i % len(colors)],
-                    customdata=df_season['seasonality_label'],
-                    hovertemplate="<b>Risk Level:</b> %{x}<br><b>Seasonality:</b> %{customdata}<br><b>Number of Loans:</b> %{y}<extra></extra>"
-                ))
-            
-            fig6.update_layout(
-                title='Loans by Risk Level and Seasonality',
-                xaxis_title='Risk Level',
-                yaxis_title='Number of Loans',
-                barmode='group',
-                legend_title_text='Seasonality'
-            )
-            st.plotly_chart(fig6, use_container_width=True)
+            plotly_chart('risk_page:seasonality', figures['seasonality'], use_container_width=True)
 
     # Show filtered raw data in a collapsed expander
     st.markdown("### Filtered Raw Data")
     with st.expander("Toggle", expanded=False):
-        st.dataframe(filtered_df)
+        show_raw_data(columns, total_rows, fetch_page)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,105 @@
+import os
+
+import pandas as pd
+import streamlit as st
+
+from dataStore import column_memory_report, schema_report
+import figurePool
+from fragmentTrace import fragment_runs
+import memoryProfile
+from perfSpans import span, span_summary, recent_spans, reset_spans, start_metrics_server, collected_metrics
+
+# The performance panel is hidden: it renders at the bottom of the app only
+# when the url has ?admin=1. NEXUS_ADMIN_PANEL=0 removes it entirely.
+ADMIN_PANEL = os.environ.get("NEXUS_ADMIN_PANEL", "1") == "1"
+
+
+def plotly_chart(name, figure, **kwargs):
+    # st.plotly_chart inside a span; it covers the figure's serialization
+    with span(f"plotly_chart:{name}"):
+        return st.plotly_chart(figure, **kwargs)
+
+
+def admin_requested():
+    return ADMIN_PANEL and st.query_params.get("admin") == "1"
+
+
+def show_perf_panel(csv_path=None):
+    # csv_path is the dataset the app is showing, None before an upload
+    if not admin_requested():
+        return
+    with st.expander("Performance", expanded=True):
+        summary = span_summary()
+        if summary:
+            st.markdown("#### Spans (process-wide, percentiles over the last calls)")
+            st.dataframe(pd.DataFrame(summary).sort_values("total_s", ascending=False).round(3),
+                         hide_index=True, use_container_width=True)
+            st.markdown("#### Latest spans")
+            st.dataframe(pd.DataFrame(recent_spans(50)).round(3), hide_index=True, use_container_width=True)
+        else:
+            st.caption("No spans recorded yet (NEXUS_PERF_SPANS=0 disables them).")
+        st.caption(f"Fragment runs in this session: {fragment_runs()}")
+        metrics = collected_metrics()
+        if metrics:
+            st.markdown("#### Caches")
+            st.dataframe(pd.DataFrame([{"source": prefix, **values} for prefix, values in metrics.items()]).round(3),
+                         hide_index=True, use_container_width=True)
+        port = start_metrics_server()
+        if port:
+            st.caption(f"Prometheus metrics: http://localhost:{port}/metrics")
+        if figurePool.task_timings():
+            show_figure_pool()
+        if memoryProfile.MEMORY_PROFILE:
+            show_memory_profile()
+        # Parses the csv again untyped, so only on request
+        if csv_path is not None and st.button("Dataset memory per column", key="perf_dtype_report"):
+            show_dtype_report(csv_path)
+        if st.button("Reset spans", key="perf_reset"):
+            reset_spans()
+            st.rerun()
+
+
+def show_figure_pool():
+    # Concurrent Dashboard renders: wall time per script run against its
+    # slowest task, then the latest tasks
+    st.markdown("#### Figure pool (NEXUS_FIGURE_WORKERS)")
+    st.dataframe(pd.DataFrame(figurePool.batch_timings()).tail(20).iloc[::-1].round(3),
+                 hide_index=True, use_container_width=True)
+    tasks = pd.DataFrame(figurePool.task_timings()).drop(columns=["submitted", "finished"])
+    st.dataframe(tasks.assign(param=tasks["param"].astype(str)).tail(40).iloc[::-1].round(3),
+                 hide_index=True, use_container_width=True)
+
+
+def show_memory_profile():
+    # Peak/retained bytes per component and the largest allocation sites
+    mb = 2 ** 20
+    st.markdown("#### Memory per component (tracemalloc, MB)")
+    summary = pd.DataFrame(memoryProfile.component_summary())
+    if not summary.empty:
+        for column in ["peak_max", "peak_last", "retained_total", "retained_last", "rss_delta_total", "rss_delta_last", "arrow_delta_total"]:
+            summary[column] = summary[column] / mb
+        st.dataframe(summary.round(2), hide_index=True, use_container_width=True)
+    st.markdown("#### Largest live allocation sites")
+    st.dataframe(pd.DataFrame(memoryProfile.allocation_sites(), columns=["site", "bytes", "blocks"])
+                 .assign(MB=lambda sites: (sites["bytes"] / mb).round(2)).drop(columns="bytes"),
+                 hide_index=True, use_container_width=True)
+    sites = memoryProfile.component_sites()
+    if sites:
+        component = st.selectbox("Retained by", sorted(sites), key="memory_sites_component")
+        st.dataframe(pd.DataFrame(sites[component], columns=["site", "bytes", "blocks"])
+                     .assign(MB=lambda rows: (rows["bytes"] / mb).round(2)).drop(columns="bytes"),
+                     hide_index=True, use_container_width=True)
+
+
+def show_dtype_report(csv_path):
+    # Schema check of the dataset and the memory its dtypes save
+    schema = schema_report(csv_path)
+    st.markdown("#### Dataset memory per column (MB)")
+    if schema["missing"] or schema["untyped"]:
+        st.caption(f"Missing columns: {schema['missing'] or '-'} · kept as read: {schema['untyped'] or '-'}")
+    report = column_memory_report(csv_path)
+    for column in ["default_bytes", "typed_bytes", "saved_bytes"]:
+        report[column] = report[column] / 2 ** 20
+    st.dataframe(report.round(2), hide_index=True, use_container_width=True)
+    st.caption(f"Total: {report['default_bytes'].sum():.2f} MB as read by pandas, "
+               f"{report['typed_bytes'].sum():.2f} MB typed")
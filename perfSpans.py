@@ -0,0 +1,196 @@
+import bisect
+import functools
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from memoryProfile import MEMORY_PROFILE, track
+
+# Timing spans around the hot path: the dataset load, the graph builders, the
+# Risk Management aggregations and the st.plotly_chart calls. Each span keeps
+# its last SPAN_WINDOW durations for percentiles plus cumulative histogram
+# counts, process-wide and shared by every session. NEXUS_PERF_SPANS=0 turns
+# recording off. NEXUS_METRICS_PORT serves the histograms in the Prometheus
+# text format on http://NEXUS_METRICS_ADDRESS:<port>/metrics, together with
+# the metrics other modules register (see register_metrics).
+PERF_SPANS = os.environ.get("NEXUS_PERF_SPANS", "1") == "1"
+SPAN_WINDOW = int(os.environ.get("NEXUS_SPAN_WINDOW", "512"))
+METRICS_PORT = int(os.environ.get("NEXUS_METRICS_PORT", "0"))
+METRICS_ADDRESS = os.environ.get("NEXUS_METRICS_ADDRESS", "127.0.0.1")
+# Upper bounds (seconds) of the histogram buckets, +Inf is implied
+HISTOGRAM_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+RECENT_SPANS = 200
+
+_lock = threading.Lock()
+_spans = {}  # name -> {"window", "buckets", "count", "sum"}
+_recent = deque(maxlen=RECENT_SPANS)  # (wall time, thread, name, seconds)
+_metrics = {}  # prefix -> (collect, counter keys, help text)
+_metrics_server = None
+
+
+def record(name, seconds):
+    with _lock:
+        stats = _spans.get(name)
+        if stats is None:
+            stats = _spans[name] = {
+                "window": deque(maxlen=SPAN_WINDOW),
+                "buckets": [0] * (len(HISTOGRAM_BUCKETS) + 1),
+                "count": 0,
+                "sum": 0.0,
+            }
+        stats["window"].append(seconds)
+        stats["buckets"][bisect.bisect_left(HISTOGRAM_BUCKETS, seconds)] += 1
+        stats["count"] += 1
+        stats["sum"] += seconds
+        _recent.append((time.time(), threading.current_thread().name, name, seconds))
+
+
+@contextmanager
+def span(name):
+    # Also the unit of attribution of the memory profiler (see memoryProfile)
+    if not PERF_SPANS and not MEMORY_PROFILE:
+        yield
+        return
+    with track(name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if PERF_SPANS:
+                record(name, time.perf_counter() - start)
+
+
+def timed(func):
+    # Decorator: one span per call, named <module>.<function>
+    name = f"{func.__module__}.{func.__name__}"
+
+    @functools.wraps(func)
+    def run(*args, **kwargs):
+        if not PERF_SPANS and not MEMORY_PROFILE:
+            return func(*args, **kwargs)
+        with span(name):
+            return func(*args, **kwargs)
+    return run
+
+
+def span_summary():
+    # Per span: total calls and seconds, percentiles over the rolling window
+    with _lock:
+        snapshot = {name: (list(stats["window"]), stats["count"], stats["sum"]) for name, stats in _spans.items()}
+    rows = []
+    for name, (window, count, total) in sorted(snapshot.items()):
+        p50, p95, p99 = np.percentile(window, [50, 95, 99])
+        rows.append({
+            "span": name,
+            "calls": count,
+            "total_s": total,
+            "p50_ms": p50 * 1000,
+            "p95_ms": p95 * 1000,
+            "p99_ms": p99 * 1000,
+            "max_ms": max(window) * 1000,
+            "last_ms": window[-1] * 1000,
+        })
+    return rows
+
+
+def recent_spans(limit=RECENT_SPANS):
+    # Latest spans first
+    with _lock:
+        recent = list(_recent)[-limit:]
+    return [
+        {"time": time.strftime("%H:%M:%S", time.localtime(wall)) + f".{int(wall % 1 * 1000):03d}",
+         "thread": thread, "span": name, "ms": seconds * 1000}
+        for wall, thread, name, seconds in reversed(recent)
+    ]
+
+
+def reset_spans():
+    with _lock:
+        _spans.clear()
+        _recent.clear()
+
+
+def register_metrics(prefix, collect, counters=(), help_text=""):
+    # collect() returns {key: number}; each key is exported as <prefix>_<key>,
+    # keys in `counters` as <prefix>_<key>_total counters, the rest as gauges
+    with _lock:
+        _metrics[prefix] = (collect, tuple(counters), help_text)
+
+
+def collected_metrics():
+    # {prefix: collect()} for every registered metric source
+    with _lock:
+        sources = dict(_metrics)
+    return {prefix: collect() for prefix, (collect, _, _) in sorted(sources.items())}
+
+
+def _label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text():
+    # All spans as one histogram metric, in the Prometheus text format
+    with _lock:
+        snapshot = {name: (list(stats["buckets"]), stats["count"], stats["sum"]) for name, stats in _spans.items()}
+    lines = [
+        "# HELP nexus_span_seconds Duration of instrumented hot-path spans.",
+        "# TYPE nexus_span_seconds histogram",
+    ]
+    for name, (buckets, count, total) in sorted(snapshot.items()):
+        label = _label(name)
+        cumulative = 0
+        for bound, bucket in zip(HISTOGRAM_BUCKETS + ("+Inf",), buckets):
+            cumulative += bucket
+            lines.append(f'nexus_span_seconds_bucket{{span="{label}",le="{bound}"}} {cumulative}')
+        lines.append(f'nexus_span_seconds_sum{{span="{label}"}} {total}')
+        lines.append(f'nexus_span_seconds_count{{span="{label}"}} {count}')
+    with _lock:
+        sources = dict(_metrics)
+    for prefix, values in collected_metrics().items():
+        _, counters, help_text = sources[prefix]
+        for key, value in values.items():
+            name = f"{prefix}_{key}_total" if key in counters else f"{prefix}_{key}"
+            lines.append(f"# HELP {name} {help_text} ({key})." if help_text else f"# HELP {name} {key}.")
+            lines.append(f"# TYPE {name} {'counter' if key in counters else 'gauge'}")
+            lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = prometheus_text().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port=None, address=None):
+    # Serve /metrics from a daemon thread, once per process. Returns the bound
+    # port, or None when disabled or the port is taken (e.g. by another process).
+    global _metrics_server
+    port = METRICS_PORT if port is None else port
+    if not port:
+        return None
+    with _lock:
+        if _metrics_server is None:
+            try:
+                _metrics_server = ThreadingHTTPServer((address or METRICS_ADDRESS, port), _MetricsHandler)
+            except OSError as error:
+                print(f"[perfSpans] metrics endpoint not started: {error}", flush=True)
+                _metrics_server = False
+            else:
+                threading.Thread(target=_metrics_server.serve_forever, name="nexus-metrics", daemon=True).start()
+        return _metrics_server.server_address[1] if _metrics_server else None
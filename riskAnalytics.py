@@ -0,0 +1,184 @@
+import numpy as np
+import pandas as pd
+
+from dataStore import load_source, derived
+from perfSpans import timed
+import sqlBackend
+
+riskclient_map = {0: "No Risk", 1: "Risk"}
+
+
+@timed
+def build_filter_index(df):
+    # One packed bitmap per riskclient value and per most_purchased_category
+    # value, so any multiselect combination is a few bitwise ORs and one AND.
+    # Categories keep their order of appearance for the multiselect, and
+    # category_display maps each "item_"-stripped name to its raw values.
+    risk_codes, risk_values = pd.factorize(df['riskclient'], sort=True)
+    category_codes, category_values = pd.factorize(df['most_purchased_category'], use_na_sentinel=False)
+
+    return {
+        'rows': len(df),
+        'risk_values': list(risk_values),
+        'risk': {value: np.packbits(risk_codes == code) for code, value in enumerate(risk_values)},
+        'category': {value: np.packbits(category_codes == code) for code, value in enumerate(category_values)},
+        'category_display': _category_display(category_values),
+    }
+
+
+def _category_display(category_values):
+    category_display = {}
+    for value in category_values:
+        display = value.replace('item_', '') if isinstance(value, str) else value
+        category_display.setdefault(display, []).append(value)
+    return category_display
+
+
+@timed
+def get_filter_index(uploaded_file):
+    # Filter index built once per dataset version and shared by every session
+    df, fingerprint = load_source(uploaded_file, columns=['riskclient', 'most_purchased_category'])
+    return derived("risk_filter_index", fingerprint, lambda: build_filter_index(df))
+
+
+@timed
+def build_sql_filter_options(path):
+    # The filter index's options (without bitmaps) read from the SQL backend
+    risk_values = sqlBackend.distinct_values(path, 'riskclient').dropna().tolist()
+    # NULL comes back as None; the pandas index labels it NaN
+    category_values = [np.nan if value is None else value
+                       for value in sqlBackend.distinct_values(path, 'most_purchased_category', order="appearance")]
+    return {
+        'risk_values': risk_values,
+        'risk': set(risk_values),
+        'category': set(category_values),
+        'category_display': _category_display(category_values),
+    }
+
+
+@timed
+def get_sql_filter_options(path):
+    return derived("risk_filter_options_sql", sqlBackend.database_fingerprint(path), lambda: build_sql_filter_options(path))
+
+
+def _any_of(bitmaps, values, size):
+    selected = [bitmaps[value] for value in values if value in bitmaps]
+    if not selected:
+        return np.zeros(size, dtype=np.uint8)
+    return np.bitwise_or.reduce(selected)
+
+
+@timed
+def filter_mask(index, risks, categories):
+    # Row mask for the selected risk levels and categories; an empty category
+    # selection means no category filter, like the page always did
+    size = (index['rows'] + 7) // 8
+    bits = _any_of(index['risk'], risks, size)
+    if categories:
+        bits = bits & _any_of(index['category'], categories, size)
+    return np.unpackbits(bits, count=index['rows']).astype(bool)
+
+
+# Every Risk Management summary groups by riskclient plus at most one of these
+SUMMARY_KEYS = ['riskclient', 'most_purchased_category', 'medio_pago', 'es_temporada_alta_real']
+SUMMARY_MEASURES = ['loan_request_id', 'approved', 'total_importe', 'num_delinquencies', 'ever_delinquent', 'days_since_affiliation']
+# Columns of the csv the Risk Management page reads (days_since_affiliation
+# is derived from fecha_afiliacion)
+RISK_PAGE_COLUMNS = SUMMARY_KEYS + SUMMARY_MEASURES[:-1] + ['fecha_afiliacion']
+
+
+def _mean(cube, column):
+    return cube[f'{column}_sum'] / cube[f'{column}_count']
+
+
+def _fold_small_categories(counts, threshold=10):
+    # Category groups with fewer than `threshold` loans for every risk level
+    # are folded into "Otros"
+    clean = counts.index.get_level_values('most_purchased_category').astype(str).str.replace('item_', '', regex=False)
+    category_group = clean.str.split('_').str[0].str.capitalize()
+    riskclient = counts.index.get_level_values('riskclient')
+    grouped = counts.groupby([riskclient, category_group]).sum()
+    grouped.index.names = ['riskclient', 'category_group']
+
+    small = grouped.groupby(level='category_group').transform('max') < threshold
+    labels = grouped.index.get_level_values('category_group').where(~small.to_numpy(), 'Otros')
+    folded = grouped.groupby([grouped.index.get_level_values('riskclient'), labels]).sum()
+    folded.index.names = ['riskclient', 'category_group']
+    return folded.rename('count').reset_index()
+
+
+@timed
+def build_summary_cube(filtered_df):
+    # The filtered rows reduced once to sums and counts per (riskclient,
+    # category, medio_pago, season) cell. Rows without a riskclient never
+    # reach a chart, so the riskclient count of a cell is its row count.
+    cube = filtered_df.groupby(SUMMARY_KEYS, dropna=False, observed=True, sort=False).agg(
+        {'riskclient': 'count', **{c: ['sum', 'count'] for c in SUMMARY_MEASURES}})
+    cube.columns = ['rows' if c == 'riskclient' else f'{c}_{stat}' for c, stat in cube.columns]
+    return cube
+
+
+@timed
+def build_risk_page_summaries(filtered_df):
+    # Every summary of the Risk Management page from a single group-by over
+    # the filtered rows
+    return summaries_from_cube(build_summary_cube(filtered_df))
+
+
+@timed
+def build_sql_risk_page_summaries(path, risks, categories, today):
+    # Same summaries with the filters and the group-by run in the SQL backend
+    return summaries_from_cube(sqlBackend.group_sums(path, SUMMARY_KEYS, SUMMARY_MEASURES, today, risks, categories))
+
+
+@timed
+def summaries_from_cube(cube):
+    # Each chart's summary is rolled up from the small cube instead of
+    # rescanning the rows
+    def rollup(levels):
+        return cube.groupby(level=levels, observed=True).sum()
+
+    by_risk = rollup(['riskclient'])
+    risk_summary = pd.DataFrame({
+        'num_loans': by_risk['loan_request_id_count'],
+        'approval_rate': _mean(by_risk, 'approved'),
+        'avg_importe': _mean(by_risk, 'total_importe'),
+        'avg_delinquencies': _mean(by_risk, 'num_delinquencies'),
+        'ever_delinquent_rate': _mean(by_risk, 'ever_delinquent'),
+    }).reset_index()
+
+    tenure_by_risk = _mean(by_risk, 'days_since_affiliation').rename('days_since_affiliation').reset_index()
+
+    category_by_risk = _fold_small_categories(rollup(['riskclient', 'most_purchased_category'])['rows'])
+
+    payment_method_by_risk = rollup(['riskclient', 'medio_pago'])['rows'].rename('count').reset_index()
+    payment_method_by_risk['medio_pago'] = payment_method_by_risk['medio_pago'].astype(str).str.capitalize()
+
+    by_season = rollup(['riskclient', 'es_temporada_alta_real'])
+    seasonality = pd.DataFrame({
+        'num_loans': by_season['loan_request_id_count'],
+        'avg_importe': _mean(by_season, 'total_importe'),
+        'avg_delinquencies': _mean(by_season, 'num_delinquencies'),
+    }).reset_index()
+    seasonality['seasonality_label'] = seasonality['es_temporada_alta_real'].map({1: 'High', 0: 'Low'})
+
+    return {
+        'risk_summary': risk_summary,
+        'category_by_risk': category_by_risk,
+        'payment_method_by_risk': payment_method_by_risk,
+        'tenure_by_risk': tenure_by_risk,
+        'seasonality': seasonality,
+    }
+
+
+def canonical_filter(index, risks, categories):
+    # Order-independent cache key of a filter selection. Selecting every
+    # category is the same as no category filter; a non-empty selection of
+    # unknown categories matches nothing and is keyed as (None,).
+    risk_key = tuple(sorted({risk for risk in risks if risk in index['risk']}))
+    valid = {category for category in categories if category in index['category']}
+    if not categories or valid == set(index['category']):
+        category_key = ()
+    else:
+        category_key = tuple(sorted(valid, key=str)) or (None,)
+    return risk_key, category_key
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+
+# HyperLogLog distinct-count sketches: 2**HLL_PRECISION one-byte registers
+# (16 KiB) per sketch, about 0.8% standard error, mergeable by register max
+HLL_PRECISION = 14
+
+
+def _bit_length(values):
+    # Exact bit length of uint64 values
+    length = np.zeros(len(values), dtype=np.int64)
+    values = values.copy()
+    for shift in (32, 16, 8, 4, 2, 1):
+        wide = values >= (np.uint64(1) << np.uint64(shift))
+        length[wide] += shift
+        values[wide] >>= np.uint64(shift)
+    return length + (values > 0)
+
+
+def hll_registers(values, precision=HLL_PRECISION):
+    # Sketch of the distinct non-null values
+    values = pd.Series(values).dropna()
+    registers = np.zeros(1 << precision, dtype=np.uint8)
+    if values.empty:
+        return registers
+    hashes = pd.util.hash_pandas_object(values.astype(str), index=False).to_numpy(dtype=np.uint64)
+    buckets = (hashes >> np.uint64(64 - precision)).astype(np.int64)
+    rest = hashes & np.uint64((1 << (64 - precision)) - 1)
+    ranks = (64 - precision) - _bit_length(rest) + 1
+    np.maximum.at(registers, buckets, ranks.astype(np.uint8))
+    return registers
+
+
+def hll_merge(*sketches):
+    return np.maximum.reduce(sketches)
+
+
+def hll_count(registers):
+    # Distinct-count estimate, with linear counting for small cardinalities
+    m = len(registers)
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / np.sum(np.ldexp(1.0, -registers.astype(np.int64)))
+    zeros = int(np.count_nonzero(registers == 0))
+    if estimate <= 2.5 * m and zeros:
+        estimate = m * np.log(m / zeros)
+    return int(round(estimate))
@@ -0,0 +1,288 @@
+import os
+import sqlite3
+import sys
+import threading
+from contextlib import closing
+
+import pandas as pd
+
+from dataStore import DEFAULT_CSV_PATH, IMPORTE_SCALE, atomic_write, file_fingerprint, is_stored_upload, typed_frame
+
+# NEXUS_QUERY_BACKEND=sqlite answers the chart rollups and the Risk Management
+# page from an embedded SQLite copy of the csv: filters and group-bys run in
+# the database and only their (small) results become pandas frames. Uploads
+# and already-loaded frames always use the pandas path.
+QUERY_BACKEND = os.environ.get("NEXUS_QUERY_BACKEND", "pandas")
+
+DATABASE_SUFFIX = ".sqlite"
+TABLE = "aggregated_df"
+META_TABLE = "nexus_meta"
+# Rows per csv chunk while building the database
+INGEST_CHUNK_ROWS = 100_000
+# total_importe in integer cents, so SQL sums match the pandas rollups exactly
+IMPORTE_CENTS = "importe_cents"
+
+INDEXES = {
+    "idx_risk_category": ["riskclient", "most_purchased_category"],
+    "idx_year": ["year"],
+}
+
+_lock = threading.Lock()
+_build_lock = threading.Lock()
+_fingerprints = {}  # csv path -> (stat, fingerprint)
+_ready = {}  # csv path -> fingerprint the database was verified against
+
+
+def use_sql(source):
+    # Uploads stay on the streamed pandas path (see uploadStream)
+    return QUERY_BACKEND == "sqlite" and isinstance(source, (str, os.PathLike)) and not is_stored_upload(source)
+
+
+def database_path(path):
+    return os.path.splitext(os.path.abspath(path))[0] + DATABASE_SUFFIX
+
+
+def _csv_fingerprint(path):
+    # Content hash of the csv, recomputed only when its mtime/size change
+    stat = os.stat(path)
+    stat = (stat.st_mtime_ns, stat.st_size)
+    with _lock:
+        cached = _fingerprints.get(path)
+    if cached is not None and cached[0] == stat:
+        return cached[1]
+    fingerprint = file_fingerprint(path)
+    with _lock:
+        _fingerprints[path] = (stat, fingerprint)
+    return fingerprint
+
+
+def _connect(database):
+    return sqlite3.connect(f"file:{database}?mode=ro", uri=True)
+
+
+def _stored_fingerprint(database):
+    if not os.path.exists(database):
+        return None
+    try:
+        with closing(_connect(database)) as conn:
+            row = conn.execute(f"SELECT value FROM {META_TABLE} WHERE key = 'source_fingerprint'").fetchone()
+    except sqlite3.Error:
+        return None
+    return row[0] if row else None
+
+
+def _with_cents(chunk):
+    if 'total_importe' in chunk.columns:
+        chunk = chunk.assign(**{IMPORTE_CENTS: (chunk['total_importe'] * IMPORTE_SCALE).round()})
+    return chunk
+
+
+def _build_database(path, database, fingerprint):
+    # Stream the csv into a new database in bounded chunks, then rename it
+    # into place (see atomic_write)
+    with atomic_write(database) as tmp_path:
+        with closing(sqlite3.connect(tmp_path)) as conn:
+            written = False
+            for chunk in pd.read_csv(path, chunksize=INGEST_CHUNK_ROWS):
+                _with_cents(chunk).to_sql(TABLE, conn, if_exists="append", index=False)
+                written = True
+            if not written:
+                _with_cents(pd.read_csv(path, nrows=0)).to_sql(TABLE, conn, index=False)
+            columns = _table_columns(conn)
+            for name, index_columns in INDEXES.items():
+                if all(c in columns for c in index_columns):
+                    conn.execute(f"CREATE INDEX {name} ON {TABLE} ({', '.join(_quote(c) for c in index_columns)})")
+            conn.execute(f"CREATE TABLE {META_TABLE} (key TEXT PRIMARY KEY, value TEXT)")
+            conn.execute(f"INSERT INTO {META_TABLE} VALUES ('source_fingerprint', ?)", (fingerprint,))
+            conn.commit()
+
+
+def database_fingerprint(path=DEFAULT_CSV_PATH):
+    # Fingerprint of the csv; the database is rebuilt whenever it is stale
+    path = os.path.abspath(path)
+    fingerprint = _csv_fingerprint(path)
+    with _lock:
+        if _ready.get(path) == fingerprint:
+            return fingerprint
+    with _build_lock:
+        database = database_path(path)
+        if _stored_fingerprint(database) != fingerprint:
+            _build_database(path, database, fingerprint)
+        with _lock:
+            _ready[path] = fingerprint
+    return fingerprint
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _table_columns(conn):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({TABLE})")]
+
+
+def query(path, sql, params=()):
+    database_fingerprint(path)
+    with closing(_connect(database_path(path))) as conn:
+        return pd.read_sql_query(sql, conn, params=params)
+
+
+def columns(path=DEFAULT_CSV_PATH):
+    # The csv's columns, without the database's helper columns
+    database_fingerprint(path)
+    with closing(_connect(database_path(path))) as conn:
+        return [c for c in _table_columns(conn) if c != IMPORTE_CENTS]
+
+
+def _in(column, values):
+    # Membership test that also matches NULL for a None/NaN value
+    values = list(values)
+    present = [v for v in values if not pd.isna(v)]
+    clauses = []
+    if present:
+        clauses.append(f"{_quote(column)} IN ({', '.join('?' for _ in present)})")
+    if len(present) < len(values):
+        clauses.append(f"{_quote(column)} IS NULL")
+    return f"({' OR '.join(clauses) or '0'})", [v.item() if hasattr(v, "item") else v for v in present]
+
+
+def year_column(path=DEFAULT_CSV_PATH):
+    # "year", or NULL for a csv without a year column: its rows only count
+    # under "All"
+    return "year" if "year" in columns(path) else "NULL"
+
+
+def where(year=None, risks=None, categories=None, year_expression="year"):
+    # WHERE clause and parameters. risks/categories follow the Risk page:
+    # risks is always applied, an empty category selection is no filter.
+    clauses, params = [], []
+    if year is not None:
+        clauses.append(f"{year_expression} = ?")
+        params.append(int(year))
+    if risks is not None:
+        clause, values = _in("riskclient", risks)
+        clauses.append(clause)
+        params += values
+    if categories:
+        clause, values = _in("most_purchased_category", categories)
+        clauses.append(clause)
+        params += values
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+# Whole days between affiliation and `today`, floored like pandas' .dt.days
+_ELAPSED = "(julianday(?) - julianday(fecha_afiliacion))"
+DAYS_SINCE_AFFILIATION = (
+    f"(CAST({_ELAPSED} AS INTEGER) - (CAST({_ELAPSED} AS INTEGER) > {_ELAPSED}))"
+)
+
+
+def _days_since_affiliation(today):
+    return DAYS_SINCE_AFFILIATION, [today] * 3
+
+
+def importe_rollup(path=DEFAULT_CSV_PATH, year=None):
+    # Sum (in cents) and count of total_importe per (year, quarter, month)
+    year_expression = year_column(path)
+    clause, params = where(year=year, year_expression=year_expression)
+    frame = query(path, f"""
+        SELECT {year_expression} AS year, quarter, month,
+               COALESCE(SUM({IMPORTE_CENTS}), 0) AS sum_cents,
+               COUNT({IMPORTE_CENTS}) AS count
+        FROM {TABLE}{clause}
+        GROUP BY {year_expression}, quarter, month
+    """, params)
+    frame['sum_cents'] = frame['sum_cents'].astype(float)
+    return frame.set_index(['year', 'quarter', 'month']).sort_index(na_position='last')
+
+
+def distinct_values(path, column, order="value", year=None):
+    # Distinct values of a column, sorted ("value", NULL last) or in order of
+    # first appearance ("appearance")
+    order_by = f"{_quote(column)} IS NULL, {_quote(column)}" if order == "value" else "MIN(rowid)"
+    clause, params = where(year=year)
+    frame = query(path, f"SELECT {_quote(column)} AS value FROM {TABLE}{clause} GROUP BY {_quote(column)} ORDER BY {order_by}", params)
+    return frame['value']
+
+
+def risk_month_counts(path=DEFAULT_CSV_PATH, year=None):
+    # Loans per (year, month, riskclient) for months 1-12 and known risk
+    # levels; without a year column per (month, riskclient), never filtered
+    has_year = year_column(path) == "year"
+    clause, params = where(year=year if has_year else None)
+    clause += (" AND " if clause else " WHERE ") + "month BETWEEN 1 AND 12 AND riskclient >= 0"
+    keys = "year, month, riskclient" if has_year else "month, riskclient"
+    return query(path, f"SELECT {keys}, COUNT(*) AS n FROM {TABLE}{clause} GROUP BY {keys}", params)
+
+
+def account_age_source(path=DEFAULT_CSV_PATH):
+    # Distinct (account, affiliation date[, age]) rows behind the account-age
+    # index, with the DATASET_SCHEMA dtypes of the pandas path
+    wanted = ['external_account_id', 'fecha_afiliacion'] + [c for c in ['account_age_years'] if c in columns(path)]
+    return typed_frame(query(path, f"SELECT DISTINCT {', '.join(_quote(c) for c in wanted)} FROM {TABLE}"))
+
+
+def group_sums(path, keys, measures, today, risks=None, categories=None):
+    # Row count plus sum/count of every measure per group of `keys`, over the
+    # filtered rows. days_since_affiliation is computed against `today`.
+    select, params = [], []
+    for measure in measures:
+        if measure == "days_since_affiliation":
+            expression, expression_params = _days_since_affiliation(today)
+        else:
+            expression, expression_params = _quote(measure), []
+        select.append(f"COALESCE(SUM({expression}), 0) AS {_quote(measure + '_sum')}")
+        select.append(f"COUNT({expression}) AS {_quote(measure + '_count')}")
+        params += expression_params * 2
+    clause, where_params = where(risks=risks, categories=categories)
+    key_list = ", ".join(_quote(k) for k in keys)
+    frame = query(path, f"""
+        SELECT {key_list}, COUNT({_quote(keys[0])}) AS rows, {', '.join(select)}
+        FROM {TABLE}{clause}
+        GROUP BY {key_list}
+    """, params + where_params)
+    return frame.set_index(keys)
+
+
+def count_rows(path, risks=None, categories=None):
+    clause, params = where(risks=risks, categories=categories)
+    return int(query(path, f"SELECT COUNT(*) AS n FROM {TABLE}{clause}", params)['n'].iloc[0])
+
+
+def page_rows(path, selected_columns, offset, limit, today, risks=None, categories=None, sort_by=None, ascending=True):
+    # One page of the filtered rows, indexed by csv row position. Missing
+    # values sort last and ties keep the csv order, like a stable pandas sort.
+    select, params = ["rowid - 1 AS row_position"], []
+    for column in selected_columns:
+        if column == "days_since_affiliation":
+            expression, expression_params = _days_since_affiliation(today)
+            select.append(f"{expression} AS days_since_affiliation")
+            params += expression_params
+        else:
+            select.append(_quote(column))
+    order = "rowid"
+    if sort_by is not None:
+        if sort_by == "days_since_affiliation":
+            expression, expression_params = _days_since_affiliation(today)
+        else:
+            expression, expression_params = _quote(sort_by), []
+        order = f"{expression} IS NULL, {expression} {'ASC' if ascending else 'DESC'}, rowid"
+        sort_params = expression_params * 2
+    else:
+        sort_params = []
+    clause, where_params = where(risks=risks, categories=categories)
+    frame = query(path, f"""
+        SELECT {', '.join(select)} FROM {TABLE}{clause}
+        ORDER BY {order} LIMIT ? OFFSET ?
+    """, params + where_params + sort_params + [int(limit), int(offset)])
+    frame = frame.set_index("row_position")
+    frame.index.name = None
+    return frame
+
+
+if __name__ == "__main__":
+    # python sqlBackend.py [csv]: build the database and check it against the
+    # pandas path (default: a synthetic csv in Data/synthetic)
+    from sqlParity import run_parity_checks
+    from syntheticData import CHECK_ROWS, synthetic_path
+    sys.exit(0 if run_parity_checks(sys.argv[1] if len(sys.argv) > 1 else synthetic_path(CHECK_ROWS)) else 1)
@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+
+import sqlBackend
+from dataStore import DEFAULT_CSV_PATH, load_dataset
+from graphImporte import get_importe_plotly_figure, get_importe_rollup
+from graphRisk import (
+    get_risk_plotly_figure,
+    get_risk_counts,
+    get_account_age_plotly_figure_by_affiliation,
+    get_account_age_index,
+)
+from riskAnalytics import (
+    get_filter_index,
+    get_sql_filter_options,
+    filter_mask,
+    build_risk_page_summaries,
+    build_sql_risk_page_summaries,
+)
+from tableViewer import sorted_positions, page_of_rows
+
+# Parity of the SQL backend with the pandas path: every chart input, chart and
+# Risk Management summary is computed both ways on the same csv and compared.
+# Run with: python sqlBackend.py [csv]
+
+
+def _with_backend(backend, build):
+    previous = sqlBackend.QUERY_BACKEND
+    sqlBackend.QUERY_BACKEND = backend
+    try:
+        return build()
+    finally:
+        sqlBackend.QUERY_BACKEND = previous
+
+
+def _both(build):
+    return _with_backend("pandas", build), _with_backend("sqlite", build)
+
+
+def _same_frame(expected, actual):
+    # Same values and labels; integer widths, categorical dtypes and the
+    # missing-value marker of text columns (NaN vs None) may differ
+    expected = expected.reset_index(drop=True)
+    actual = actual.reset_index(drop=True)
+    for frame in (expected, actual):
+        for column in frame.columns:
+            if not pd.api.types.is_numeric_dtype(frame[column]) and not pd.api.types.is_datetime64_any_dtype(frame[column]):
+                frame[column] = frame[column].astype(object).where(frame[column].notna(), None)
+    try:
+        pd.testing.assert_frame_equal(expected, actual, check_dtype=False, check_index_type=False,
+                                      check_column_type=False)
+    except AssertionError:
+        return False
+    return True
+
+
+def _sorted_summary(frame):
+    return frame.sort_values(list(frame.columns[:2])).reset_index(drop=True)
+
+
+def _checks(path):
+    df = load_dataset(path)
+    years = ["All"] + sorted(int(y) for y in df['year'].dropna().unique())
+
+    pandas_rollup, sql_rollup = _both(lambda: get_importe_rollup(path))
+    yield "importe rollup", _same_frame(pandas_rollup.reset_index(), sql_rollup.reset_index())
+
+    (pandas_counts, pandas_years), (sql_counts, sql_years) = _both(lambda: get_risk_counts(path))
+    yield "risk counts", np.array_equal(pandas_counts, sql_counts) and pd.Index(pandas_years).equals(pd.Index(sql_years))
+
+    pandas_index, sql_index = _both(lambda: get_account_age_index(path))
+    yield "account age index", np.array_equal(pandas_index['prefix'], sql_index['prefix']) and pd.Index(
+        pandas_index['years']).equals(pd.Index(sql_index['years']))
+
+    for year in years:
+        for name, build in (("importe", get_importe_plotly_figure), ("risk", get_risk_plotly_figure)):
+            pandas_fig, sql_fig = _both(lambda: build(path, year=year))
+            yield f"{name} figure {year}", pandas_fig.to_json() == sql_fig.to_json()
+    fecha_afiliacion = pd.to_datetime(df['fecha_afiliacion'])
+    bounds = (int(fecha_afiliacion.min().year), int(fecha_afiliacion.max().year))
+    for year_range in (None, bounds, (bounds[1], bounds[1])):
+        pandas_fig, sql_fig = _both(lambda: get_account_age_plotly_figure_by_affiliation(path, year_range=year_range))
+        yield f"account age figure {year_range}", pandas_fig.to_json() == sql_fig.to_json()
+
+    # Risk Management page: filters, summaries and raw data pages
+    today = pd.Timestamp.today().date().isoformat()
+    frame = df.assign(fecha_afiliacion=fecha_afiliacion,
+                      days_since_affiliation=(pd.Timestamp.today().normalize() - fecha_afiliacion).dt.days)
+    index = get_filter_index(path)
+    options = get_sql_filter_options(path)
+    yield "risk filter options", (index['risk_values'] == options['risk_values']
+                                  and pd.Index(list(index['category_display'])).equals(pd.Index(list(options['category_display']))))
+
+    categories = list(index['category'])
+    selections = [
+        ("all", index['risk_values'], []),
+        ("risk only", index['risk_values'][-1:], []),
+        ("some categories", index['risk_values'], categories[:3]),
+        ("no risk level", [], []),
+    ]
+    columns = list(frame.columns)
+    for label, risks, selected in selections:
+        mask = filter_mask(index, risks, selected)
+        expected = build_risk_page_summaries(frame[mask])
+        actual = build_sql_risk_page_summaries(path, risks, selected, today)
+        same = all(_same_frame(_sorted_summary(expected[name]), _sorted_summary(actual[name])) for name in expected)
+        yield f"risk summaries ({label})", same
+
+        positions = np.flatnonzero(mask)
+        yield f"row count ({label})", len(positions) == sqlBackend.count_rows(path, risks, selected)
+        for sort_by, ascending in ((None, True), ('total_importe', False), ('days_since_affiliation', True)):
+            expected_rows = page_of_rows(frame, sorted_positions(frame, positions, sort_by, ascending), 2, 50, columns)
+            actual_rows = sqlBackend.page_rows(path, columns, 50, 50, today, risks, selected, sort_by, ascending)
+            actual_rows['fecha_afiliacion'] = pd.to_datetime(actual_rows['fecha_afiliacion'])
+            same = _same_frame(expected_rows, actual_rows) and list(expected_rows.index) == list(actual_rows.index)
+            yield f"raw data page ({label}, {sort_by} {'asc' if ascending else 'desc'})", same
+
+
+def run_parity_checks(path=DEFAULT_CSV_PATH):
+    # Prints one line per check; True when every check passed
+    passed = True
+    for name, ok in _checks(path):
+        print(f"[sqlParity] {'ok  ' if ok else 'FAIL'} {name}", flush=True)
+        passed = passed and bool(ok)
+    return passed
@@ -0,0 +1,129 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from dataStore import DATA_DIR, atomic_write
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:  # pandas writes the csv, several times slower
+    pa = None
+
+# aggregated_df-shaped csvs of any size, for benchmarks. The payment methods,
+# the approval and delinquency rates and the loans per quarter are those of
+# the private dataset as summarised in the committed kpis.json; about five
+# loans per account, one affiliation date per account between 2019-01-01
+# and 2025-01-08 and six purchase categories (two of them rare) are assumed.
+SYNTHETIC_DIR = os.path.join(DATA_DIR, "synthetic")
+# Part of the generated file names, bumped whenever the generated data changes
+GENERATOR_VERSION = 2
+# Rows generated and written per chunk, so memory does not grow with the size
+CHUNK_ROWS = 1_000_000
+# Rows of the csv the parity checks run on when they are given none
+CHECK_ROWS = 20_000
+LOANS_PER_ACCOUNT = 5
+
+AFFILIATION_START = pd.Timestamp("2019-01-01")
+AFFILIATION_DAYS = 2200
+CATEGORIES = {
+    "item_ropa_caballero": 0.309,
+    "item_ropa_dama": 0.300,
+    "item_calzado": 0.198,
+    "item_hogar_cocina": 0.183,
+    "item_x_rare": 0.005,
+    "item_y_rare": 0.005,
+}
+PAYMENT_METHODS = [
+    "AMERICAN EXPRES", "DOCUMENTO", "EFECTIVO", "MESES SIN INTERESES", "MONEDERO ELECTRONICO",
+    "PRESTAMO XIMPLE", "TARJETA CREDITO", "TARJETA DEBITO", "USO SALDO",
+]
+CHANNELS = ["ONLINE", "TIENDA"]
+APPROVAL_RATE = 0.851
+DELINQUENCY_RATE = 0.097
+# (year, quarter) -> loans; months are uniform within a quarter
+QUARTER_LOANS = {(2024, 1): 1159, (2024, 2): 442, (2024, 3): 470, (2024, 4): 539, (2025, 1): 139}
+
+COLUMNS = [
+    'loan_request_id', 'external_account_id', 'approved', 'total_importe', 'year', 'quarter', 'month',
+    'ever_delinquent', 'num_delinquencies', 'most_purchased_category', 'medio_pago', 'canal', 'riskclient',
+    'es_temporada_alta_real', 'fecha_afiliacion',
+]
+
+
+def parse_size(text):
+    # "50000", "10k" or "50M" -> number of rows
+    text = text.strip().lower().replace("_", "")
+    scale = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text[:-1] if scale > 1 else text) * scale)
+
+
+def _chunk(rng, first_id, rows, affiliation_days, affiliation_labels):
+    accounts = rng.integers(0, len(affiliation_days), rows)
+    keys = np.array(list(QUARTER_LOANS))
+    loans = np.array(list(QUARTER_LOANS.values()))
+    year, quarter = keys[rng.choice(len(keys), rows, p=loans / loans.sum())].T
+    months = (quarter - 1) * 3 + rng.integers(1, 4, rows)
+    return pd.DataFrame({
+        'loan_request_id': np.arange(first_id, first_id + rows),
+        'external_account_id': "acc_" + pd.Series(accounts).astype(str),
+        'approved': (rng.random(rows) < APPROVAL_RATE).astype(np.int64),
+        'total_importe': rng.gamma(2.0, 400.0, rows).round(2),
+        'year': year,
+        'quarter': quarter,
+        'month': months,
+        'ever_delinquent': (rng.random(rows) < DELINQUENCY_RATE).astype(np.int64),
+        'num_delinquencies': np.minimum(rng.poisson(0.2, rows), 4),
+        'most_purchased_category': rng.choice(list(CATEGORIES), rows, p=list(CATEGORIES.values())),
+        'medio_pago': rng.choice(PAYMENT_METHODS, rows),
+        'canal': rng.choice(CHANNELS, rows),
+        'riskclient': rng.integers(0, 2, rows),
+        'es_temporada_alta_real': rng.integers(0, 2, rows),
+        'fecha_afiliacion': affiliation_labels[affiliation_days[accounts]],
+    }, columns=COLUMNS)
+
+
+def generate(rows, path, seed=0, chunk_rows=CHUNK_ROWS):
+    # Write `rows` synthetic loans to `path`; the same seed gives the same file
+    rng = np.random.default_rng(seed)
+    affiliation_days = rng.integers(0, AFFILIATION_DAYS, max(1, rows // LOANS_PER_ACCOUNT))
+    dates = AFFILIATION_START + pd.to_timedelta(np.arange(AFFILIATION_DAYS), unit="D")
+    affiliation_labels = np.asarray(dates.strftime("%Y-%m-%d"), dtype=object)
+
+    chunks = (
+        _chunk(rng, start + 1, min(chunk_rows, rows - start), affiliation_days, affiliation_labels)
+        for start in range(0, rows, chunk_rows)
+    )
+    with atomic_write(path) as tmp_path:
+        pd.DataFrame(columns=COLUMNS).to_csv(tmp_path, index=False)
+        if pa is not None:
+            # Generated values never contain delimiters, so nothing is quoted
+            options = pa_csv.WriteOptions(include_header=False, quoting_style="none")
+            with open(tmp_path, "ab") as f:
+                for chunk in chunks:
+                    pa_csv.write_csv(pa.Table.from_pandas(chunk, preserve_index=False), f, write_options=options)
+        else:
+            for chunk in chunks:
+                chunk.to_csv(tmp_path, mode="a", header=False, index=False)
+    return path
+
+
+def synthetic_path(rows, seed=0, directory=SYNTHETIC_DIR):
+    # Path of a generated csv, generating it on first use
+    path = os.path.join(directory, f"aggregated_df_{rows}_seed{seed}_v{GENERATOR_VERSION}.csv")
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        generate(rows, path, seed)
+    return path
+
+
+if __name__ == "__main__":
+    # python syntheticData.py 1M [out.csv]
+    parser = argparse.ArgumentParser(description="Generate an aggregated_df-shaped csv")
+    parser.add_argument("rows", type=parse_size, help="number of rows, e.g. 10k, 1M, 50M")
+    parser.add_argument("path", nargs="?", help=f"output csv (default: {SYNTHETIC_DIR}/aggregated_df_<rows>_seed<seed>_v<version>.csv)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(generate(args.rows, args.path, args.seed) if args.path else synthetic_path(args.rows, args.seed))
@@ -0,0 +1,33 @@
+import math
+
+import numpy as np
+
+from perfSpans import timed
+
+# Rows per page offered by the raw data viewer
+PAGE_SIZES = [25, 50, 100, 250]
+
+
+@timed
+def sorted_positions(df, positions, sort_by=None, ascending=True):
+    # Row positions of df in display order. Only the sort column of the
+    # selected rows is read; missing values go last in either direction.
+    if sort_by is None:
+        return positions
+    values = df[sort_by].take(positions).reset_index(drop=True)
+    order = values.sort_values(ascending=ascending, kind='stable', na_position='last').index.to_numpy()
+    return positions[order]
+
+
+def page_count(total_rows, page_size):
+    return max(1, math.ceil(total_rows / page_size))
+
+
+@timed
+def page_of_rows(df, positions, page, page_size, columns=None):
+    # One page (1-based) of the selected rows, projected to `columns`. The
+    # page's rows are taken first, so only they are copied.
+    page = min(max(1, page), page_count(len(positions), page_size))
+    start = (page - 1) * page_size
+    rows = df.take(np.asarray(positions[start:start + page_size]))
+    return rows if columns is None else rows[list(columns)]
@@ -0,0 +1,58 @@
+import os
+
+import pandas as pd
+
+from dataStore import store_upload, derived, is_stored_upload, upload_fingerprint, check_columns, typed_frame
+
+# Uploaded csvs are aggregated in chunks of this many rows, so peak memory
+# depends on the chunk size and the size of the aggregates, not on the file.
+# Uploads are streamed whether they arrive as file-like objects or as the
+# path of their stored copy. NEXUS_UPLOAD_STREAMING=0 parses uploads whole.
+UPLOAD_CHUNK_ROWS = int(os.environ.get("NEXUS_UPLOAD_CHUNK_ROWS", "200000"))
+UPLOAD_STREAMING = os.environ.get("NEXUS_UPLOAD_STREAMING", "1") == "1"
+
+
+def is_streamed(source):
+    return UPLOAD_STREAMING and (hasattr(source, "read") or is_stored_upload(source))
+
+
+def iter_chunks(source, columns, chunk_rows=None, optional=()):
+    # Typed chunks of the upload restricted to `columns`, which the header
+    # must hold, and the `optional` ones it has; an empty upload yields one
+    # empty frame with its header
+    source.seek(0)
+    try:
+        usecols = check_columns(pd.read_csv(source, nrows=0).columns, columns, optional)
+        source.seek(0)
+        reader = pd.read_csv(source, chunksize=chunk_rows or UPLOAD_CHUNK_ROWS, usecols=usecols)
+        empty = True
+        for chunk in reader:
+            empty = False
+            yield typed_frame(chunk)
+        if empty:
+            source.seek(0)
+            yield typed_frame(pd.read_csv(source, nrows=0, usecols=usecols))
+    finally:
+        source.seek(0)
+
+
+def fold_chunks(source, columns, build, merge, chunk_rows=None, optional=()):
+    # build() the first chunk, then merge() every following chunk into it
+    result = None
+    for chunk in iter_chunks(source, columns, chunk_rows, optional):
+        result = build(chunk) if result is None else merge(result, chunk)
+    return result
+
+
+def fold_upload(source, name, columns, build, merge, daily=False, optional=()):
+    # fold_chunks over the stored copy of an upload, once per content hash
+    # (and per day with daily=True, see dataStore.derived)
+    if is_stored_upload(source):
+        path, fingerprint = source, upload_fingerprint(source)
+    else:
+        path, fingerprint = store_upload(source)
+
+    def fold():
+        with open(path, "rb") as f:
+            return fold_chunks(f, columns, build, merge, optional=optional)
+    return derived(name, fingerprint, fold, daily=daily)
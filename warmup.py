@@ -0,0 +1,102 @@
+import threading
+
+import plotly.graph_objects as go
+
+from dataStore import DEFAULT_CSV_PATH, load_dataset, path_fingerprint, is_loaded, has_derived, derived
+from graphImporte import IMPORTE_COLUMNS, get_importe_plotly_figure, get_importe_rollup, get_importe_years
+from graphRisk import (
+    RISK_COLUMNS,
+    ACCOUNT_AGE_COLUMNS,
+    get_risk_plotly_figure,
+    get_risk_counts,
+    get_account_age_plotly_figure_by_affiliation,
+    get_account_age_index,
+    get_affiliation_year_bounds,
+)
+from kpiEngine import get_kpis, kpi_table_frames
+
+# Columns of the csv the Dashboard tab needs; year and account_age_years are
+# optional and the KPIs fall back to kpis.json
+REQUIRED_COLUMNS = list(dict.fromkeys(IMPORTE_COLUMNS + RISK_COLUMNS + ACCOUNT_AGE_COLUMNS))
+
+# Figures of the Dashboard tab, cached per dataset version and parameter
+FIGURE_BUILDERS = {
+    "importe": lambda path, year: get_importe_plotly_figure(path, year=year, height=500),
+    "risk": lambda path, year: get_risk_plotly_figure(path, year=year, height=500),
+    "account_age": lambda path, year_range: get_account_age_plotly_figure_by_affiliation(path, year_range=year_range),
+}
+
+
+# Figures whose bins depend on today's date; the previous day's are evicted
+# when the first figure of a new day is built
+DAILY_FIGURES = {"account_age"}
+
+
+def dashboard_figure(kind, path, param):
+    # A private copy of the cached figure, so callers can update its layout
+    figure = derived(f"figure:{kind}:{param}", path_fingerprint(path), lambda: FIGURE_BUILDERS[kind](path, param),
+                     daily=kind in DAILY_FIGURES)
+    return go.Figure(figure)
+
+
+def figure_cached(kind, path, param):
+    # Whether dashboard_figure(kind, path, param) is already in memory
+    return has_derived(f"figure:{kind}:{param}", path_fingerprint(path), daily=kind in DAILY_FIGURES)
+
+
+def _default_figures(path):
+    for kind, param in (("importe", "All"), ("risk", "All"), ("account_age", get_affiliation_year_bounds(path))):
+        dashboard_figure(kind, path, param)
+
+
+# (label, work) pairs run in order by the warm-up worker
+WARMUP_STAGES = [
+    ("Loading dataset", lambda path: load_dataset(path)),
+    ("Computing KPIs", get_kpis),
+    ("Building monthly importe rollup", get_importe_rollup),
+    ("Counting risk clients by month", get_risk_counts),
+    ("Indexing account ages", get_account_age_index),
+    ("Rendering default charts", _default_figures),
+]
+
+_lock = threading.Lock()
+_jobs = {}
+
+
+def is_warm(path=DEFAULT_CSV_PATH):
+    # True when the dataset and the default figures are already cached
+    if not is_loaded(path):
+        return False
+    fingerprint = path_fingerprint(path)
+    return has_derived("kpi_stats", fingerprint) and all(
+        has_derived(f"figure:{kind}:All", fingerprint) for kind in ("importe", "risk"))
+
+
+def _run(job, path):
+    try:
+        for index, (label, work) in enumerate(WARMUP_STAGES):
+            job["stage"] = label
+            work(path)
+            job["completed"] = index + 1
+    except Exception as error:  # surfaced by the page that needs the data
+        job["error"] = error
+    finally:
+        job["done"].set()
+
+
+def start_warmup(path=DEFAULT_CSV_PATH):
+    # One background warm-up per dataset path, shared by concurrent sessions.
+    # The job dict exposes "stage", "completed", "total", "error" and "done".
+    with _lock:
+        job = _jobs.get(path)
+        if job is None or job["done"].is_set():
+            job = {
+                "stage": WARMUP_STAGES[0][0],
+                "completed": 0,
+                "total": len(WARMUP_STAGES),
+                "error": None,
+                "done": threading.Event(),
+            }
+            _jobs[path] = job
+            threading.Thread(target=_run, args=(job, path), daemon=True, name="nexus-warmup").start()
+        return job